@@ -0,0 +1,102 @@
+"""
+`acquisition`
+================================================================================
+
+Background sensor acquisition for the weather station.
+
+Every bus gets a :class:`BusWorker` thread that runs the reads of the sensors on
+that bus at their own cadence and publishes the results into a shared
+:class:`Snapshot`. The render loop only reads the snapshot, so a slow sensor
+conversion never delays a display refresh.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from scheduler import Scheduler
+
+Reading = namedtuple('Reading', ('name', 'value', 'timestamp', 'error'))
+Reading.__doc__ = """Immutable sensor reading published into a :class:`Snapshot`.
+
+:param str name: Name of the sensor task that produced the reading.
+:param value: The reading itself, None if the read failed.
+:param float timestamp: :func:`time.monotonic` time the read completed.
+:param Exception error: The exception raised by the read, or None."""
+
+
+class Snapshot:
+    """Latest-value store shared between the bus workers and the render loop.
+
+    Publishing swaps in a new dictionary instead of mutating the current one, so
+    readers never need a lock and always see a consistent set of readings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._readings = {}
+        self.version = 0
+
+    def publish(self, name, value, error=None):
+        """Store `value` as the latest reading of `name`. Returns the :class:`Reading`."""
+        reading = Reading(name, value, time.monotonic(), error)
+        with self._lock:
+            readings = dict(self._readings)
+            readings[name] = reading
+            self._readings = readings
+            self.version += 1
+        return reading
+
+    def get(self, name, default=None):
+        """Returns the latest :class:`Reading` of `name`, or `default` if there is none yet"""
+        return self._readings.get(name, default)
+
+    def latest(self):
+        """Returns a dictionary of the latest :class:`Reading` of every sensor. The dictionary is
+        never modified after it is returned."""
+        return self._readings
+
+    def age(self, name):
+        """Seconds since `name` last published, or None if it never did"""
+        reading = self._readings.get(name)
+        if reading is None:
+            return None
+        return time.monotonic() - reading.timestamp
+
+
+class BusWorker(threading.Thread):
+    """Runs the reads of every sensor on one bus in a background thread.
+
+    :param str name: Name of the bus, used for the thread name and the report.
+    :param Snapshot snapshot: Where the readings are published."""
+
+    def __init__(self, name, snapshot):
+        super().__init__(name=name, daemon=True)
+        self.snapshot = snapshot
+        self.scheduler = Scheduler()
+
+    def add(self, name, read, interval, deadline=None, delay=0.0):
+        """Call `read` every `interval` seconds, first `delay` seconds from now, and publish
+        its return value as `name`"""
+        return self.scheduler.add(name, lambda: self._acquire(name, read), interval, deadline, delay)
+
+    def _acquire(self, name, read):
+        try:
+            value = read()
+        except Exception as error:  # pylint: disable=broad-except
+            self.snapshot.publish(name, None, error=error)
+            raise
+        self.snapshot.publish(name, value)
+
+    def run(self):
+        self.scheduler.run()
+
+    def stop(self, timeout=None):
+        """Stop the worker after its current read and wait for the thread to finish"""
+        self.scheduler.stop()
+        if self.is_alive():
+            self.join(timeout)
+
+    def report(self):
+        """Print the scheduler statistics of the worker"""
+        print(f"[{self.name}]")
+        self.scheduler.report()
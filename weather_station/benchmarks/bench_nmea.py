@@ -0,0 +1,152 @@
+"""
+Microbenchmark of the NMEA field decoding of `seeed_air530`.
+
+Times `_parse_data()` on GGA, RMC, GSA and GSV sentences with the decoders
+compiled from `_SENTENCE_PARAMS` ("after") against the type string
+interpreter they replaced ("before", kept below), checking that both return
+the same values. Results are printed, or written to `--json`, as JSON:
+
+    python benchmarks/bench_nmea.py --number 100000
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import seeed_air530  # noqa: E402
+from seeed_air530 import (  # noqa: E402
+    _GGA, _GSA, _GSV19, _RMC, _SENTENCE_PARAMS, _ST_MAX, _ST_MIN,
+    _parse_degrees, _parse_float, _parse_int, _parse_str,
+)
+
+# (sentence type, fields) of each benchmarked sentence
+SENTENCES = {
+    'GGA': (_GGA, b'102100.000,3554.9000,N,01429.7000,E,1,08,1.02,52.0,M,46.9,M,,'),
+    'RMC': (_RMC, b'102100.000,A,3554.9000,N,01429.7000,E,1.20,45.00,090721,,,A'),
+    'GSA': (_GSA, b'A,3,04,05,09,12,24,25,29,31,,,,,1.80,1.02,1.48'),
+    'GSV': (_GSV19, b'3,1,12,04,24,148,29,05,25,185,30,09,29,333,34,12,32,084,37'),
+}
+
+
+def interpreted_parse_data(sentence_type, data):
+    """The previous _parse_data(), dispatching on the type string for every field"""
+    # pylint: disable=too-many-branches
+
+    if not _ST_MIN <= sentence_type <= _ST_MAX:
+        return None
+
+    param_types = _SENTENCE_PARAMS[sentence_type]
+
+    if len(param_types) != len(data):
+        return None
+
+    params = []
+    try:
+        for i, dti in enumerate(data):
+            pti = param_types[i]
+            len_dti = len(dti)
+            nothing = dti is None or len_dti == 0
+            if pti == "_":
+                params.append(None)
+            elif pti == "c":
+                if len_dti != 1:
+                    return None
+                params.append(chr(dti[0]))
+            elif pti == "C":
+                if nothing:
+                    params.append(None)
+                elif len_dti != 1:
+                    return None
+                else:
+                    params.append(chr(dti[0]))
+            elif pti == "d":
+                params.append(_parse_degrees(dti))
+            elif pti == "D":
+                if nothing:
+                    params.append(None)
+                else:
+                    params.append(_parse_degrees(dti))
+            elif pti == "f":
+                params.append(_parse_float(dti))
+            elif pti == "i":
+                params.append(_parse_int(dti))
+            elif pti == "I":
+                if nothing:
+                    params.append(None)
+                else:
+                    params.append(_parse_int(dti))
+            elif pti == "s":
+                params.append(dti.decode("ascii"))
+            elif pti == "S":
+                params.append(_parse_str(dti))
+            else:
+                raise TypeError(f"GPS: Unexpected parameter type '{pti}'")
+    except (ValueError, UnicodeError):
+        return None
+
+    return params
+
+
+def best_time(func, args, number, repeat):
+    """Returns the best time of one call of `func(*args)`, in nanoseconds"""
+    times = timeit.repeat(lambda: func(*args), number=number, repeat=repeat)
+    return 1e9 * min(times) / number
+
+
+def run(args):
+    results = {}
+    for name, (sentence_type, sentence) in SENTENCES.items():
+        data = sentence.split(b',')
+        before = interpreted_parse_data(sentence_type, data)
+        after = seeed_air530._parse_data(sentence_type, data)  # pylint: disable=protected-access
+        if before != after:
+            raise AssertionError(f'{name}: decoders disagree, {before} != {after}')
+
+        before_ns = best_time(interpreted_parse_data, (sentence_type, data), args.number, args.repeat)
+        after_ns = best_time(seeed_air530._parse_data, (sentence_type, data),  # pylint: disable=protected-access
+                             args.number, args.repeat)
+        results[name] = {
+            'fields': len(data),
+            'before_ns': before_ns,
+            'after_ns': after_ns,
+            'speedup': before_ns / after_ns,
+        }
+
+    return {
+        'benchmark': 'nmea_decode',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'number': args.number, 'repeat': args.repeat},
+        'sentences': results,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--number', type=int, default=20000,
+                        help='decodes per timing run (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timing runs, the best one is reported (default: %(default)s)')
+    parser.add_argument('--json', help='write the results to this file instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
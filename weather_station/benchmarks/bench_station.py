@@ -0,0 +1,243 @@
+"""
+End-to-end benchmark of the station loop without any hardware.
+
+Builds the real pipeline with :func:`main.init` on top of the stand-ins in
+`fakes`: a fake I2C bus serving BME680 registers and HM3301 frames, a fake
+serial port replaying NMEA and two SSD1306 sinks. Every iteration runs the
+same stages as the station (GPS poll, BME680 and HM3301 reads, both OLED
+refreshes) in line, timing each one, and turns to the next page every
+`--page-every` iterations.
+
+The results are printed, or written to `--json`, as JSON:
+
+    python benchmarks/bench_station.py --iterations 2000 --json station.json
+
+The drivers (adafruit_ssd1306, adafruit_bus_device, PIL) must be installed,
+the hardware modules are faked.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakes  # noqa: E402
+
+STAGES = ('gps', 'bme680', 'hm3301', 'oled1', 'oled2')
+
+
+def percentiles(samples):
+    """Returns the latency summary of `samples`, in microseconds"""
+    if not samples:
+        return {}
+
+    ordered = sorted(samples)
+    count = len(ordered)
+
+    def pick(fraction):
+        return 1e6 * ordered[min(count - 1, int(fraction * count))]
+
+    return {
+        'count': count,
+        'mean': 1e6 * sum(ordered) / count,
+        'p50': pick(0.50),
+        'p90': pick(0.90),
+        'p99': pick(0.99),
+        'max': 1e6 * ordered[-1],
+    }
+
+
+def build(args):
+    """Install the fakes and initialise the station. Returns (main, hardware, sensors, oleds)"""
+    nmea = None
+    if args.nmea:
+        with open(args.nmea, 'rb') as f:
+            nmea = f.read()
+
+    hardware = fakes.Hardware(nmea=nmea, nmea_speed=args.nmea_speed, simulate_time=args.simulate_bus,
+                              hm3301_corrupt_every=args.hm3301_corrupt)
+    fakes.install(hardware)
+
+    import main  # pylint: disable=import-outside-toplevel
+
+    # the bus clock is set through a scratch file instead of sysfs
+    clk = tempfile.NamedTemporaryFile('w', suffix='_bus_clk_rate', delete=False)
+    clk.write(str(main.i2c1_clk_rate))
+    clk.close()
+    try:
+        sensors, oleds = main.init(on_turn=None, clk_path=clk.name)
+    finally:
+        os.unlink(clk.name)
+
+    return main, hardware, sensors, oleds
+
+
+def make_stages(main, sensors, oleds):
+    """Returns the (name, callable) stages of one loop iteration"""
+    air530, bme680, hm3301 = sensors[:3]
+    snapshot = main.snapshot
+    bme680_due = [0.0]
+
+    def sample_bme680():
+        # trigger, then collect once the conversion time is over, as the station does
+        if not bme680.measuring:
+            bme680_due[0] = bme680.start_measurement()
+        elif time.monotonic() >= bme680_due[0]:
+            snapshot.publish('bme680', tuple(main.get_bme680_data(bme680)))
+
+    return [
+        ('gps', lambda: snapshot.publish('gps', main.poll_air530(air530))),
+        ('bme680', sample_bme680),
+        ('hm3301', lambda: snapshot.publish('hm3301', tuple(main.get_hm3301_data(hm3301)))),
+        ('oled1', lambda: main.refresh_oled(oleds[0])),
+        ('oled2', lambda: main.refresh_oled(oleds[1], data=True)),
+    ]
+
+
+def run_loop(main, stages, iterations, page_every, timings=None):
+    """Run `iterations` loop iterations, appending the stage latencies to `timings`.
+    Returns the wall time taken."""
+    clock = time.perf_counter
+    start = clock()
+    for i in range(iterations):
+        if page_every and i % page_every == 0:
+            main.display_item = (i // page_every) % main.item_length
+        for name, stage in stages:
+            t0 = clock()
+            stage()
+            if timings is not None:
+                timings[name].append(clock() - t0)
+    return clock() - start
+
+
+def measure_allocations(main, stages, iterations, page_every):
+    """Returns the memory allocated by the loop, per iteration"""
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        run_loop(main, stages, iterations, page_every)
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'net_blocks_per_iteration': (sys.getallocatedblocks() - blocks) / iterations,
+        'net_bytes_per_iteration': (after - before) / iterations,
+        'peak_bytes': peak - before,
+    }
+
+
+def run(args):
+    main, hardware, sensors, oleds = build(args)
+    stages = make_stages(main, sensors, oleds)
+    air530 = sensors[0]
+
+    # let the GPS reader buffer some sentences and fill the frame cache
+    time.sleep(args.settle)
+    run_loop(main, stages, args.warmup, args.page_every)
+
+    sinks_before = [sink.data_bytes + sink.command_bytes for sink in hardware.oleds]
+    timings = {name: [] for name in STAGES}
+    elapsed = run_loop(main, stages, args.iterations, args.page_every, timings)
+
+    displays = {}
+    for i, (oled, sink, before) in enumerate(zip(oleds, hardware.oleds, sinks_before)):
+        pushed = sink.data_bytes + sink.command_bytes - before
+        displays['oled%d' % (i + 1)] = {
+            'address': '0x%02X' % sink.address,
+            'bytes_pushed': pushed,
+            'bytes_per_iteration': pushed / args.iterations,
+            'stats': oled.stats(),
+            'sink': sink.stats(),
+        }
+
+    allocations = None
+    if args.alloc_iterations:
+        allocations = measure_allocations(main, stages, args.alloc_iterations, args.page_every)
+
+    air530.stop_reader(timeout=1)
+    for bus in main.buses:
+        bus.close(timeout=1)
+
+    return {
+        'benchmark': 'station',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.time(),
+        'config': {
+            'iterations': args.iterations,
+            'warmup': args.warmup,
+            'page_every': args.page_every,
+            'simulate_bus': args.simulate_bus,
+            'nmea': args.nmea,
+            'nmea_speed': args.nmea_speed,
+            'hm3301_corrupt': args.hm3301_corrupt,
+        },
+        'elapsed': elapsed,
+        'iterations_per_second': args.iterations / elapsed if elapsed > 0 else 0.0,
+        'stages_us': {name: percentiles(samples) for name, samples in timings.items()},
+        'allocations': allocations,
+        'displays': displays,
+        'buses': [bus.stats() for bus in main.buses],
+        'frame_cache': main.frame_cache.stats(),
+        'readings': {name: reading.value for name, reading in main.snapshot.latest().items()},
+        'gps': {
+            'bytes_received': air530.bytes_received,
+            'bytes_dropped': air530.bytes_dropped,
+            'overruns': air530.overruns,
+            'sentences_parsed': air530.sentences_parsed,
+        },
+        'sensors': {
+            'bme680': hardware.bme680.stats(),
+            'hm3301': hardware.hm3301.stats(),
+            'hm3301_driver': sensors[2].stats(),
+        },
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help='timed loop iterations (default: %(default)s)')
+    parser.add_argument('--warmup', type=int, default=100,
+                        help='untimed iterations before the measurement (default: %(default)s)')
+    parser.add_argument('--page-every', type=int, default=10,
+                        help='turn to the next page every N iterations, 0 to stay on the first page '
+                             '(default: %(default)s)')
+    parser.add_argument('--alloc-iterations', type=int, default=200,
+                        help='iterations traced with tracemalloc, 0 to skip (default: %(default)s)')
+    parser.add_argument('--settle', type=float, default=1.0,
+                        help='seconds of NMEA to buffer before the warmup (default: %(default)s)')
+    parser.add_argument('--simulate-bus', action='store_true',
+                        help='make the fake I2C transfers take as long as on the wire')
+    parser.add_argument('--nmea', help='file of recorded NMEA to replay instead of the built in track')
+    parser.add_argument('--nmea-speed', type=float, default=1.0,
+                        help='replay the NMEA this many times faster than 9600 baud (default: %(default)s)')
+    parser.add_argument('--hm3301-corrupt', type=int, default=0,
+                        help='corrupt every Nth HM3301 frame, 0 for none (default: %(default)s)')
+    parser.add_argument('--json', help='write the results to this file instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,637 @@
+"""
+`fakes`
+================================================================================
+
+Hardware stand-ins for running the weather station without a Jetson.
+
+* :class:`FakeI2C` replaces :class:`busio.I2C` and routes transfers to device
+  models by address: :class:`FakeBME680`, :class:`FakeHM3301` and
+  :class:`FakeSSD1306`.
+* :class:`FakeSerial` replaces :class:`serial.Serial` and replays recorded NMEA
+  at the rate the baud rate allows.
+* :class:`PtyAir530` simulates the GPS module on a pseudo terminal, for tests
+  with a real :class:`serial.Serial`.
+
+:func:`install` puts fake `board`, `busio`, `serial` and `RPi.GPIO` modules in
+:data:`sys.modules` so that :func:`main.init` builds the real pipeline on top
+of them. The drivers themselves (adafruit_ssd1306, adafruit_bus_device, ...)
+are the real ones and must be installed.
+"""
+
+import functools
+import math
+import operator
+import struct
+import sys
+import threading
+import time
+import types
+
+
+class FakeDevice:
+    """Register file device: writes are (register, value...) and set the register pointer,
+    reads return the registers from the pointer on."""
+
+    def __init__(self, address):
+        self.address = address
+        self.registers = bytearray(256)
+        self.pointer = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.transfers = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        self.transfers += 1
+        if not data:
+            return
+        self.pointer = data[0]
+        if len(data) > 1:
+            self.write_registers(data)
+
+    def write_registers(self, data):
+        self.registers[data[0]:data[0] + len(data) - 1] = data[1:]
+
+    def read(self, buffer):
+        self.bytes_read += len(buffer)
+        self.transfers += 1
+        end = self.pointer + len(buffer)
+        buffer[:] = self.registers[self.pointer:end]
+
+    def stats(self):
+        return {
+            "bytes_written": self.bytes_written,
+            "bytes_read": self.bytes_read,
+            "transfers": self.transfers,
+        }
+
+
+class FakeBME680(FakeDevice):
+    """BME680 model with a fixed calibration and slowly drifting raw readings"""
+
+    # T2, T3, -, P1, P2, P3, -, P4, P5, P7, P6, -, P8, P9, P10, -, H2, H1, H3, H4, H5, H6, H7,
+    # T1, G2, G1, G3 in the order the driver unpacks them
+    CALIBRATION = (26454, 3, 0, 36007, -10355, 88, 0, 6594, -93, 46, 30, 0, -3077, -1548, 30,
+                   0, 62, 11200, 0, 45, 20, 120, -100, 26091, -10000, -30, 18)
+
+    def __init__(self, address=0x76):
+        super().__init__(address)
+        regs = self.registers
+        regs[0xD0] = 0x61  # chip id
+        coeff = struct.pack("<hbBHhbBhhbbHhhBBBHbbbBbHhbb", *self.CALIBRATION)
+        regs[0x8A:0x8A + 24] = coeff[:24]
+        regs[0xE1:0xE1 + 14] = coeff[24:]
+        regs[0x02] = 0x10
+        regs[0x00] = 0x40
+        regs[0x04] = 0x20
+        self.samples = 0
+
+    def write(self, data):
+        # like the chip, a write alternates register addresses and values and the
+        # address a read starts from is the last one written
+        self.bytes_written += len(data)
+        self.transfers += 1
+        if not data:
+            return
+        self.write_registers(data)
+        self.pointer = data[-1] if len(data) % 2 else data[-2]
+
+    def write_registers(self, data):
+        # writes are (register, value) pairs, an odd trailing byte only moves the pointer
+        for i in range(0, len(data) - 1, 2):
+            register, value = data[i], data[i + 1]
+            self.registers[register] = value
+            if register == 0x74 and value & 0x03 == 0x01:
+                self._measure()
+
+    def _measure(self):
+        # forced mode measurement, results are ready straight away
+        self.samples += 1
+        drift = math.sin(self.samples / 50)
+        temp = int(520000 + 4000 * drift) << 4
+        pres = int(420000 + 1500 * drift) << 4
+        hum = int(26000 + 800 * drift)
+        regs = self.registers
+        regs[0x1D] = 0x80
+        regs[0x1F:0x22] = pres.to_bytes(3, "big")
+        regs[0x22:0x25] = temp.to_bytes(3, "big")
+        regs[0x25:0x27] = hum.to_bytes(2, "big")
+        regs[0x2A:0x2C] = ((400 << 6) | 0x34).to_bytes(2, "big")
+
+
+class FakeHM3301(FakeDevice):
+    """HM3301 model returning checksummed 29 byte frames with drifting concentrations.
+    Every `corrupt_every` frame, if set, has a flipped bit."""
+
+    def __init__(self, address=0x40, corrupt_every=0):
+        super().__init__(address)
+        self.frames = 0
+        self.corrupt_every = corrupt_every
+
+    def frame(self):
+        self.frames += 1
+        step = self.frames // 10
+        values = [0x0000, 0x001C,
+                  5 + step % 3, 8 + step % 5, 11 + step % 7,
+                  5 + step % 3, 8 + step % 5, 11 + step % 7,
+                  1200, 350, 60, 8, 2, 1]
+        frame = bytearray(struct.pack(">14H", *values)) + b"\x00"
+        frame[28] = sum(frame[:28]) & 0xFF
+        if self.corrupt_every and self.frames % self.corrupt_every == 0:
+            frame[6] ^= 0x04
+        return frame
+
+    def write_registers(self, data):
+        pass
+
+    def read(self, buffer):
+        self.bytes_read += len(buffer)
+        self.transfers += 1
+        buffer[:] = self.frame()[:len(buffer)]
+
+
+class FakeSSD1306(FakeDevice):
+    """SSD1306 sink that only counts what is pushed to it"""
+
+    def __init__(self, address):
+        super().__init__(address)
+        self.data_bytes = 0
+        self.command_bytes = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        self.transfers += 1
+        if not data:
+            return
+        # control byte: D/C# set for display data, clear for commands
+        if data[0] & 0x40:
+            self.data_bytes += len(data) - 1
+        else:
+            self.command_bytes += len(data) - 1
+
+    def stats(self):
+        stats = super().stats()
+        stats["data_bytes"] = self.data_bytes
+        stats["command_bytes"] = self.command_bytes
+        return stats
+
+
+class FakeI2C:
+    """Stand-in for :class:`busio.I2C` routing transfers to the device models.
+
+    :param devices: The device models on the bus.
+    :param int frequency: Bus clock, used when `simulate_time` is set.
+    :param bool simulate_time: Sleep for the time the transfers would take on the bus."""
+
+    def __init__(self, devices=(), frequency=100000, simulate_time=False):
+        self.devices = {device.address: device for device in devices}
+        self.frequency = frequency
+        self.simulate_time = simulate_time
+        self._lock = threading.Lock()
+
+    def _device(self, address):
+        device = self.devices.get(address)
+        if device is None:
+            raise OSError(5, "No device at 0x%02X" % address)
+        return device
+
+    def _wait(self, length):
+        if self.simulate_time:
+            # 9 clocks per byte plus the address byte
+            time.sleep(9 * (length + 1) / self.frequency)
+
+    def try_lock(self):
+        return self._lock.acquire(False)
+
+    def unlock(self):
+        self._lock.release()
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        data = bytes(buffer[start:end])
+        self._device(address).write(data)
+        self._wait(len(data))
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        view = memoryview(buffer)[start:end]
+        self._device(address).read(view)
+        self._wait(len(view))
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, *, out_start=0,
+                              out_end=None, in_start=0, in_end=None):
+        self.writeto(address, buffer_out, start=out_start, end=out_end)
+        self.readfrom_into(address, buffer_in, start=in_start, end=in_end)
+
+    def deinit(self):
+        pass
+
+
+def nmea_checksum(body):
+    """Returns the '*XX' NMEA checksum of `body` (bytes between '$' and '*')"""
+    return b"*%02X" % functools.reduce(operator.xor, body, 0)
+
+
+def nmea_sentence(body):
+    """Returns the complete NMEA line for `body`, e.g. b'GPGGA,...'"""
+    return b"$" + body + nmea_checksum(body) + b"\r\n"
+
+
+def sample_nmea(seconds=60, start=(2021, 7, 9, 10, 21, 0)):
+    """Returns `seconds` worth of Air530 output: GGA, GSA, 3 x GSV, RMC, ZDA and TXT per second,
+    on a slow track heading north-east"""
+    year, month, day, hour, minute, second = start
+    lines = []
+    for i in range(seconds):
+        total = hour * 3600 + minute * 60 + second + i
+        hms = b"%02d%02d%02d.000" % (total // 3600 % 24, total // 60 % 60, total % 60)
+        lat = 3554.9000 + 0.0100 * i
+        lon = 1429.7000 + 0.0100 * i
+        lat_field = b"%09.4f" % lat
+        lon_field = b"%010.4f" % lon
+        date = b"%02d%02d%02d" % (day, month, year % 100)
+
+        lines.append(nmea_sentence(b"GNGGA,%s,%s,N,%s,E,1,08,1.02,%.1f,M,46.9,M,," % (
+            hms, lat_field, lon_field, 52.0 + (i % 10) / 10)))
+        lines.append(nmea_sentence(b"GNGSA,A,3,04,05,09,12,24,25,29,31,,,,,1.80,1.02,1.48"))
+        for part, sats in enumerate(((4, 5, 9, 12), (24, 25, 29, 31), (33, 36, 40, 41))):
+            fields = b",".join(b"%02d,%02d,%03d,%02d" % (prn, 20 + prn, (prn * 37) % 360,
+                                                         25 + (prn + i) % 20) for prn in sats)
+            lines.append(nmea_sentence(b"GPGSV,3,%d,12,%s" % (part + 1, fields)))
+        lines.append(nmea_sentence(b"GNRMC,%s,A,%s,N,%s,E,1.20,45.00,%s,,,A" % (
+            hms, lat_field, lon_field, date)))
+        lines.append(nmea_sentence(b"GNZDA,%s,%02d,%02d,%04d,00,00" % (hms, day, month, year)))
+        lines.append(nmea_sentence(b"GPTXT,01,01,01,ANTENNA OK"))
+    return b"".join(lines)
+
+
+# PMTK314 output frequency field of each sentence type
+PMTK314_FIELDS = {b"GLL": 0, b"RMC": 1, b"VTG": 2, b"GGA": 3, b"GSA": 4, b"GSV": 5, b"ZDA": 17}
+
+
+class MtkModule:
+    """Command side of an MTK GPS module shared by :class:`FakeSerial` and :class:`PtyAir530`.
+
+    Acknowledges PMTK commands with PMTK001 like the real module: PMTK314 limits
+    the sentences of the recording that are sent, PMTK220 sets `fix_interval` and
+    PMTK251 switches `baudrate` (without an acknowledgement). Other commands are
+    reported as unsupported.
+
+    :param bytes recording: Recorded output of the module, one fix per second.
+    :param bool pmtk: Acknowledge PMTK commands, False simulates a module ignoring them.
+    :param int baudrate: Baud rate the module starts at."""
+
+    def __init__(self, recording=None, pmtk=True, baudrate=9600):
+        self.recording = sample_nmea() if recording is None else recording
+        self.data = self.recording
+        self.pmtk = pmtk
+        self.baudrate = baudrate
+        self.fix_interval = 1000
+        self.commands = []
+        self._command = bytearray()
+
+    def receive(self, data):
+        """Take bytes written to the module, returns the replies to send back"""
+        replies = bytearray()
+        self._command += data
+        while b"\n" in self._command:
+            line, _, rest = bytes(self._command).partition(b"\n")
+            self._command = bytearray(rest)
+            replies += self._handle_command(line.strip())
+        return bytes(replies)
+
+    def _handle_command(self, line):
+        if not line.startswith(b"$PMTK") or line[-3:-2] != b"*":
+            return b""
+        body = line[1:-3]
+        if nmea_checksum(body) != line[-3:]:
+            return b""
+        self.commands.append(body)
+        if not self.pmtk:
+            return b""
+
+        command = body[4:7]
+        fields = body.split(b",")[1:]
+        flag = 1  # unsupported
+        try:
+            if command == b"314":
+                self._set_output([int(field) for field in fields])
+                flag = 3
+            elif command == b"220":
+                self.fix_interval = int(fields[0])
+                flag = 3
+            elif command == b"251":
+                self.baudrate = int(fields[0])
+                return b""
+        except (ValueError, IndexError):
+            flag = 0  # invalid
+        return nmea_sentence(b"PMTK001,%s,%d" % (command, flag))
+
+    def _set_output(self, frequencies):
+        # send only the enabled sentences of the recording
+        if len(frequencies) != 19:
+            raise ValueError("PMTK314 takes 19 fields")
+        enabled = {sentence for sentence, field in PMTK314_FIELDS.items() if frequencies[field]}
+        lines = self.recording.splitlines(True)
+        self.data = b"".join(line for line in lines if line[3:6] in enabled)
+
+    def fixes(self):
+        """Returns the enabled output split into fixes, each starting with the sentence
+        type the recording starts with"""
+        lines = self.data.splitlines(True)
+        if not lines:
+            return []
+        first = lines[0][:6]
+        fixes = []
+        for line in lines:
+            if line.startswith(first) or not fixes:
+                fixes.append(bytearray())
+            fixes[-1] += line
+        return [bytes(fix) for fix in fixes]
+
+
+class FakeSerial:
+    """Stand-in for :class:`serial.Serial` replaying NMEA data in a loop, with the
+    command handling of :class:`MtkModule`.
+
+    :param bytes data: Recorded output of the GPS module.
+    :param int baudrate: Bytes become available at `baudrate / 10` per second.
+    :param float timeout: Read timeout in seconds, like pyserial.
+    :param float speed: Replay `speed` times faster than the baud rate allows.
+    :param bool pmtk: Acknowledge PMTK commands, False simulates a module ignoring them."""
+
+    def __init__(self, port=None, baudrate=9600, timeout=None, data=None, speed=1.0, pmtk=True,
+                 **kwargs):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.module = MtkModule(data, pmtk=pmtk, baudrate=baudrate)
+        self.speed = speed
+        self.written = bytearray()
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._start = time.monotonic()
+        self._position = 0
+        self._replies = bytearray()
+        self._line_start = True
+
+    def _available_total(self):
+        return int((time.monotonic() - self._start) * self.speed * self.baudrate / 10)
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            return len(self._replies) + max(0, self._available_total() - self._position)
+
+    def _take(self, size):
+        data = self.module.data
+        with self._lock:
+            chunk = bytearray()
+            while len(chunk) < size:
+                if self._replies and self._line_start:
+                    # command replies go out between the replayed sentences
+                    piece = bytes(self._replies[:size - len(chunk)])
+                    del self._replies[:len(piece)]
+                else:
+                    available = self._available_total() - self._position
+                    if available <= 0 or not data:
+                        break
+                    offset = self._position % len(data)
+                    piece = data[offset:offset + min(size - len(chunk), available)]
+                    if self._replies:
+                        # finish the current sentence before the replies
+                        piece = piece[:piece.find(b"\n") + 1 or len(piece)]
+                    self._position += len(piece)
+                self._line_start = piece.endswith(b"\n")
+                chunk += piece
+            self.bytes_read += len(chunk)
+            return bytes(chunk)
+
+    def read(self, size=1):
+        """Read up to `size` bytes, waiting up to `timeout` for the first one"""
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        self._cancel.clear()
+        while True:
+            chunk = self._take(size)
+            if chunk or self._cancel.is_set():
+                return chunk
+            if deadline is not None and time.monotonic() >= deadline:
+                return chunk
+            time.sleep(0.001)
+
+    def readline(self):
+        """Read up to and including the next newline"""
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            chunk = self.read(1)
+            if not chunk:
+                break
+            line += chunk
+        return bytes(line)
+
+    def write(self, data):
+        self.written += data
+        replies = self.module.receive(data)
+        if replies:
+            with self._lock:
+                self._replies += replies
+        return len(data)
+
+    def cancel_read(self):
+        self._cancel.set()
+
+    def reset_input_buffer(self):
+        with self._lock:
+            self._position = self._available_total()
+
+    def close(self):
+        self.cancel_read()
+
+
+def _termios_speeds():
+    import termios  # pylint: disable=import-outside-toplevel
+
+    speeds = {}
+    for baudrate in (4800, 9600, 14400, 19200, 38400, 57600, 115200):
+        speed = getattr(termios, "B%d" % baudrate, None)
+        if speed is not None:
+            speeds[speed] = baudrate
+    return speeds
+
+
+class PtyAir530:
+    """Simulated GPS receiver on a pseudo terminal, for testing against a real
+    :class:`serial.Serial` opened on :attr:`port`.
+
+    A thread sends the fixes of :class:`MtkModule` every `fix_interval` at the
+    module's baud rate. While the port is not set to the same baud rate as the
+    module, like on a real UART, the host only receives garbage and the module
+    does not understand the commands it is sent. POSIX only.
+
+    :param bytes data: Recorded output of the module.
+    :param int baudrate: Baud rate the module starts at.
+    :param bool pmtk: Acknowledge PMTK commands."""
+
+    def __init__(self, data=None, baudrate=9600, pmtk=True):
+        # pylint: disable=import-outside-toplevel
+        import fcntl
+        import os
+        import tty
+
+        self.module = MtkModule(data, pmtk=pmtk, baudrate=baudrate)
+        self.bytes_sent = 0
+        self.bytes_dropped = 0
+        self.fixes_sent = 0
+        self._speeds = _termios_speeds()
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        # a full pty drops data like a UART nobody reads instead of blocking the module
+        flags = fcntl.fcntl(self._master, fcntl.F_GETFL)
+        fcntl.fcntl(self._master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.port = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pty-air530", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        import os  # pylint: disable=import-outside-toplevel
+
+        self._stop.set()
+        self._thread.join(1)
+        os.close(self._master)
+        os.close(self._slave)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def host_baudrate(self):
+        """Baud rate the port is currently set to by the host"""
+        import termios  # pylint: disable=import-outside-toplevel
+
+        return self._speeds.get(termios.tcgetattr(self._master)[5])
+
+    def _linked(self):
+        return self.host_baudrate == self.module.baudrate
+
+    def _write(self, data):
+        import os  # pylint: disable=import-outside-toplevel
+
+        if not self._linked():
+            # framing errors: the bytes arrive, but not the ones that were sent
+            data = bytes((byte ^ 0x5A) | 0x80 for byte in data)
+        try:
+            self.bytes_sent += os.write(self._master, data)
+        except BlockingIOError:
+            self.bytes_dropped += len(data)
+
+    def _service(self, timeout=0.0):
+        # handle the commands written by the host, waiting up to `timeout` for them
+        import os  # pylint: disable=import-outside-toplevel
+        import select  # pylint: disable=import-outside-toplevel
+
+        readable, _, _ = select.select([self._master], [], [], max(0.0, timeout))
+        if not readable:
+            return
+        try:
+            data = os.read(self._master, 1024)
+        except (BlockingIOError, OSError):
+            return
+        if self._linked():
+            replies = self.module.receive(data)
+            if replies:
+                self._write(replies)
+
+    def _run(self):
+        index = 0
+        while not self._stop.is_set():
+            # the output configuration applies from the next fix on
+            fixes = self.module.fixes()
+            fix = fixes[index % len(fixes)] if fixes else b""
+            index += 1
+
+            start = time.monotonic()
+            for line in fix.splitlines(True):
+                if self._stop.is_set():
+                    return
+                self._write(line)
+                # the time the line takes on the wire
+                self._wait(time.monotonic() + 10 * len(line) / self.module.baudrate)
+            self.fixes_sent += 1
+
+            # wait for the next fix
+            self._wait(start + self.module.fix_interval / 1000)
+
+    def _wait(self, deadline):
+        # answer commands as they arrive until `deadline`, so that they are
+        # received at the baud rate they were sent with
+        while not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._service(remaining)
+
+
+class FakeSPI:
+    """Placeholder for :class:`busio.SPI`, nothing on the station uses SPI"""
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+class Hardware:
+    """The fake devices behind the buses and the serial port created by :func:`install`"""
+
+    def __init__(self, nmea=None, nmea_speed=1.0, simulate_time=False, hm3301_corrupt_every=0):
+        self.nmea = nmea
+        self.nmea_speed = nmea_speed
+        self.simulate_time = simulate_time
+        self.bme680 = FakeBME680(0x76)
+        self.hm3301 = FakeHM3301(0x40, corrupt_every=hm3301_corrupt_every)
+        self.oleds = [FakeSSD1306(0x3C), FakeSSD1306(0x3D)]
+        self.buses = []
+        self.serial_ports = []
+
+    def i2c(self, scl, sda, frequency=100000):
+        # board.SCL_1/SDA_1 is i2c0 with the sensors, board.SCL/SDA is i2c1 with the displays
+        if scl == "SCL_1":
+            devices = (self.bme680, self.hm3301)
+        else:
+            devices = self.oleds
+        bus = FakeI2C(devices, frequency=frequency, simulate_time=self.simulate_time)
+        self.buses.append(bus)
+        return bus
+
+    def serial(self, port=None, baudrate=9600, timeout=None, **kwargs):
+        uart = FakeSerial(port, baudrate=baudrate, timeout=timeout, data=self.nmea,
+                          speed=self.nmea_speed)
+        self.serial_ports.append(uart)
+        return uart
+
+
+def install(hardware):
+    """Install fake `board`, `busio`, `serial` and `RPi.GPIO` modules backed by `hardware`"""
+    board = _module("board", SCL="SCL", SDA="SDA", SCL_1="SCL_1", SDA_1="SDA_1")
+    # SPI is only needed by the type hints of adafruit_bus_device
+    busio = _module("busio", I2C=hardware.i2c, SPI=FakeSPI)
+    serial = _module("serial", Serial=hardware.serial)
+    gpio = _module("RPi.GPIO", IN=1, OUT=0, FALLING=32, RISING=31, BOTH=33,
+                   setmode=lambda *args, **kwargs: None,
+                   setup=lambda *args, **kwargs: None,
+                   add_event_detect=lambda *args, **kwargs: None,
+                   cleanup=lambda *args, **kwargs: None)
+    rpi = _module("RPi", GPIO=gpio)
+
+    sys.modules.update({"board": board, "busio": busio, "serial": serial,
+                        "RPi": rpi, "RPi.GPIO": gpio})
@@ -0,0 +1,261 @@
+"""
+`busmanager`
+================================================================================
+
+Per-bus transaction queue for the weather station's I2C buses.
+
+Every driver on a bus submits its transfers to the bus' :class:`BusManager`
+instead of talking to :class:`busio.I2C` directly. A single thread per bus runs
+the transfers, taking turns between devices so that one busy device cannot
+starve the others, merges back-to-back register writes into one transfer and
+keeps the bus utilisation and queue wait statistics.
+
+Drivers built on :class:`adafruit_bus_device.i2c_device.I2CDevice` need no
+change: pass them :meth:`BusManager.client` in place of the bus.
+"""
+
+import threading
+import time
+from collections import deque
+
+_WRITE = 0
+_READ = 1
+_WRITE_READ = 2
+
+
+class Transaction:
+    """A transfer queued on a :class:`BusManager`, waited on with :meth:`result`"""
+
+    __slots__ = ("address", "kind", "out_buffer", "in_buffer", "posted",
+                 "submitted", "error", "_done")
+
+    def __init__(self, address, kind, out_buffer=None, in_buffer=None, posted=False):
+        self.address = address
+        self.kind = kind
+        self.out_buffer = out_buffer
+        self.in_buffer = in_buffer
+        self.posted = posted
+        self.submitted = time.monotonic()
+        self.error = None
+        self._done = threading.Event()
+
+    def result(self, timeout=None):
+        """Wait for the transfer to finish, raising the error it failed with"""
+        if not self._done.wait(timeout):
+            raise TimeoutError("I2C transaction to 0x%02X timed out" % self.address)
+        if self.error is not None:
+            raise self.error
+
+
+class BusManager:
+    """Serialises, orders and batches every transaction on one I2C bus.
+
+    :param ~busio.I2C i2c: The bus to manage.
+    :param str name: Name of the bus used in the statistics.
+    :param coalesce: Addresses of devices taking any number of (register, value) pairs in
+      one write, such as the BME680. Their pair writes are posted without waiting and
+      back-to-back ones are merged into a single transfer. A write of odd length, like the
+      register pointer sent before a read, is never posted nor merged."""
+
+    def __init__(self, i2c, name="i2c", coalesce=()):
+        self.i2c = i2c
+        self.name = name
+        self.coalesce = frozenset(coalesce)
+
+        self._queues = {}
+        self._ready = deque()
+        self._errors = {}
+        self._condition = threading.Condition()
+        self._running = True
+
+        self.started = time.monotonic()
+        self.busy_time = 0.0
+        self.transactions = 0
+        self.transfers = 0
+        self.coalesced = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.device_transactions = {}
+
+        self._thread = threading.Thread(target=self._run, name=name + "-bus", daemon=True)
+        self._thread.start()
+
+    def client(self):
+        """Returns a :class:`ManagedI2C` to hand to a driver in place of the bus"""
+        return ManagedI2C(self)
+
+    def submit(self, transaction):
+        """Queue `transaction` behind the pending transfers of its device"""
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Bus %s is closed" % self.name)
+            queue = self._queues.get(transaction.address)
+            if queue is None:
+                queue = self._queues[transaction.address] = deque()
+            if not queue:
+                self._ready.append(transaction.address)
+            queue.append(transaction)
+            self._condition.notify()
+        return transaction
+
+    def execute(self, transaction):
+        """Queue `transaction` and wait for it, raising any error of an earlier posted write
+        to the same device"""
+        self.submit(transaction)
+        transaction.result()
+        error = self._errors.pop(transaction.address, None)
+        if error is not None:
+            raise error
+
+    def close(self, timeout=None):
+        """Finish the queued transactions and stop the bus thread"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _next(self):
+        """Take the next transfer in round-robin device order, merging posted writes"""
+        with self._condition:
+            while not self._ready:
+                if not self._running:
+                    return None
+                self._condition.wait()
+
+            address = self._ready.popleft()
+            queue = self._queues[address]
+            batch = [queue.popleft()]
+            if batch[0].posted:
+                while queue and queue[0].posted:
+                    batch.append(queue.popleft())
+            if queue:
+                # the device goes to the back of the line
+                self._ready.append(address)
+            return batch
+
+    def _run(self):
+        i2c = self.i2c
+        while True:
+            batch = self._next()
+            if batch is None:
+                return
+
+            first = batch[0]
+            start = time.monotonic()
+            for transaction in batch:
+                wait = start - transaction.submitted
+                self.wait_time += wait
+                if wait > self.max_wait:
+                    self.max_wait = wait
+
+            while not i2c.try_lock():
+                pass
+            try:
+                if first.kind == _WRITE:
+                    if len(batch) > 1:
+                        out_buffer = b"".join(transaction.out_buffer for transaction in batch)
+                    else:
+                        out_buffer = first.out_buffer
+                    i2c.writeto(first.address, out_buffer)
+                elif first.kind == _READ:
+                    i2c.readfrom_into(first.address, first.in_buffer)
+                else:
+                    i2c.writeto_then_readfrom(first.address, first.out_buffer, first.in_buffer)
+            except Exception as error:  # pylint: disable=broad-except
+                if first.posted:
+                    # nobody waits for posted writes, report it on the next transfer
+                    self._errors[first.address] = error
+                for transaction in batch:
+                    transaction.error = error
+            finally:
+                i2c.unlock()
+
+            self.busy_time += time.monotonic() - start
+            self.transfers += 1
+            self.transactions += len(batch)
+            self.coalesced += len(batch) - 1
+            self.device_transactions[first.address] = (
+                self.device_transactions.get(first.address, 0) + len(batch))
+            for transaction in batch:
+                transaction._done.set()  # pylint: disable=protected-access
+
+    @property
+    def queue_depth(self):
+        """Number of transactions waiting for the bus"""
+        with self._condition:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        """Returns a dictionary with the bus utilisation and queue wait statistics"""
+        elapsed = time.monotonic() - self.started
+        return {
+            "name": self.name,
+            "utilisation": self.busy_time / elapsed if elapsed > 0 else 0.0,
+            "transactions": self.transactions,
+            "transfers": self.transfers,
+            "coalesced": self.coalesced,
+            "mean_wait": self.wait_time / self.transactions if self.transactions else 0.0,
+            "max_wait": self.max_wait,
+            "queue_depth": self.queue_depth,
+            "devices": dict(self.device_transactions),
+        }
+
+    def report(self):
+        """Print the bus statistics"""
+        stats = self.stats()
+        devices = ", ".join("0x%02X: %d" % item for item in sorted(stats["devices"].items()))
+        print("%s: %.1f%% busy, %d transactions in %d transfers (%d coalesced), "
+              "wait %.2f ms mean / %.2f ms max [%s]" % (
+                  stats["name"], 100 * stats["utilisation"], stats["transactions"],
+                  stats["transfers"], stats["coalesced"], 1000 * stats["mean_wait"],
+                  1000 * stats["max_wait"], devices))
+
+
+class ManagedI2C:
+    """Stand-in for :class:`busio.I2C` that runs every transfer through a :class:`BusManager`.
+
+    :param BusManager manager: The manager of the bus."""
+
+    def __init__(self, manager):
+        self._manager = manager
+        self._lock = threading.Lock()
+
+    def try_lock(self):
+        """Lock the client, the manager itself takes care of ordering on the bus"""
+        return self._lock.acquire(False)
+
+    def unlock(self):
+        """Release the client lock"""
+        self._lock.release()
+
+    def scan(self):
+        """Returns the addresses of the devices that ACK on the bus"""
+        i2c = self._manager.i2c
+        while not i2c.try_lock():
+            pass
+        try:
+            return i2c.scan()
+        finally:
+            i2c.unlock()
+
+    def writeto(self, address, buffer, *, start=0, end=None):
+        """Write `buffer[start:end]` to the device at `address`"""
+        data = bytes(buffer[start:end])
+        # only whole (register, value) pairs can be merged, a register pointer write
+        # must reach the device on its own right before the read it is for
+        if address in self._manager.coalesce and data and not len(data) % 2:
+            self._manager.submit(Transaction(address, _WRITE, data, posted=True))
+            return
+        self._manager.execute(Transaction(address, _WRITE, data))
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        """Read into `buffer[start:end]` from the device at `address`"""
+        view = memoryview(buffer)[start:end]
+        self._manager.execute(Transaction(address, _READ, in_buffer=view))
+
+    def writeto_then_readfrom(self, address, buffer_out, buffer_in, *, out_start=0,
+                              out_end=None, in_start=0, in_end=None):
+        """Write `buffer_out` then read into `buffer_in` with a repeated start"""
+        data = bytes(buffer_out[out_start:out_end])
+        view = memoryview(buffer_in)[in_start:in_end]
+        self._manager.execute(Transaction(address, _WRITE_READ, data, view))
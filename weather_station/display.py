@@ -0,0 +1,306 @@
+"""
+`display`
+================================================================================
+
+Text rendering for the weather station's SSD1306 OLED displays.
+
+:class:`OledDisplay` remembers the content last sent to its display and skips
+both drawing and the i2c transfer when a refresh would show the same frame.
+Rendered frames are kept, already packed in the SSD1306 page layout, in a
+:class:`FrameCache` so that repeated text costs a dictionary lookup instead
+of a FreeType rasterisation.
+
+PIL and the fonts are only loaded when the first frame has to be rendered.
+"""
+
+import os
+from collections import OrderedDict
+
+# Set default font dor OLED Displays
+fwd = os.path.dirname(os.path.abspath(__file__))
+font_path = fwd + '/fonts/Oswald-Medium.ttf'
+
+# font sizes of the layouts
+font_default = 16
+font_big = 24
+font_huge = 30
+
+_fonts = {}
+
+
+def load_font(size):
+    """Returns the OLED font in `size` points, loading it on first use"""
+    font = _fonts.get(size)
+    if font is None:
+        from PIL import ImageFont  # pylint: disable=import-outside-toplevel
+
+        font = _fonts[size] = ImageFont.truetype(font_path, size)
+    return font
+
+
+def _layout(text, data):
+    """Returns the font size, first line offset and line pitch used to draw `text`"""
+    if not data:
+        return font_big, 5, 23
+
+    lines = text.count('\n') + 1
+    if lines == 1:
+        return font_huge, 15, 25
+    elif lines == 2:
+        return font_big, 5, 23
+    return font_default, 3, 20
+
+
+def pack_image(image):
+    """Pack a 1-bit PIL image into the SSD1306 page layout: one byte per column of
+    8 pixels, least significant bit at the top."""
+    from PIL import Image  # pylint: disable=import-outside-toplevel
+
+    width, height = image.size
+    pages = []
+    for page in range(0, height, 8):
+        # rotating a page clockwise turns each 8 pixel column into one packed byte
+        pages.append(image.crop((0, page, width, page + 8)).transpose(Image.ROTATE_270).tobytes())
+    return b''.join(pages)
+
+
+def render_frame(width, height, text, data=False):
+    """Draw `text` centred on a blank `width` x `height` image and return it packed for the
+    SSD1306. `data` selects the sensor value layout, otherwise the title layout is used."""
+    from PIL import Image, ImageDraw  # pylint: disable=import-outside-toplevel
+
+    # create a blank image on which the text will be placed
+    image = Image.new('1', (width, height))
+    draw = ImageDraw.Draw(image)
+
+    # First define some constants to allow easy resizing of shapes.
+    padding = -2
+    top = padding
+
+    size, offset, pitch = _layout(text, data)
+    font = load_font(size)
+
+    # parse the text
+    for i, item in enumerate(text.split('\n')):
+        w, h = draw.textsize(item, font)
+        draw.text(((width-w)/2+2, top+offset+(i*pitch)), item, font=font, fill=255)
+
+    return pack_image(image)
+
+
+class FrameCache:
+    """Bounded LRU cache of packed SSD1306 frames, keyed by text, font size and layout.
+
+    :param int max_entries: Maximum number of cached frames.
+    :param int max_bytes: Maximum memory used by the cached frame buffers."""
+
+    def __init__(self, max_entries=64, max_bytes=64 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._frames = OrderedDict()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def get(self, key):
+        """Returns the frame cached under `key` or None, marking it as recently used"""
+        frame = self._frames.get(key)
+        if frame is None:
+            self.misses += 1
+            return None
+
+        self._frames.move_to_end(key)
+        self.hits += 1
+        return frame
+
+    def put(self, key, frame):
+        """Cache `frame` under `key`, evicting the least recently used frames over the limits"""
+        if len(frame) > self.max_bytes:
+            return
+
+        old = self._frames.pop(key, None)
+        if old is not None:
+            self.nbytes -= len(old)
+        self._frames[key] = frame
+        self.nbytes += len(frame)
+
+        while len(self._frames) > self.max_entries or self.nbytes > self.max_bytes:
+            _, evicted = self._frames.popitem(last=False)
+            self.nbytes -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every cached frame"""
+        self._frames.clear()
+        self.nbytes = 0
+
+    def stats(self):
+        """Returns a dictionary with the hit, miss and eviction counters"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._frames),
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# SSD1306 addressing commands used for windowed updates
+_SET_COL_ADDR = 0x21
+_SET_PAGE_ADDR = 0x22
+
+# bus bytes spent on the addressing commands and the data header of one window
+_WINDOW_OVERHEAD = 10
+
+
+def dirty_windows(old, new, width):
+    """Compare two packed frames and return the (first page, last page, first column,
+    last column) windows covering every changed byte. Neighbouring dirty pages are merged
+    into one window when that puts fewer bytes on the bus."""
+    windows = []
+    for page in range(len(new) // width):
+        start = page * width
+        old_page = old[start:start + width]
+        new_page = new[start:start + width]
+        if old_page == new_page:
+            continue
+
+        # the highest and lowest set bits of the xor mark the first and last changed column
+        diff = int.from_bytes(old_page, 'big') ^ int.from_bytes(new_page, 'big')
+        first = width - 1 - (diff.bit_length() - 1) // 8
+        last = width - 1 - ((diff & -diff).bit_length() - 1) // 8
+
+        if windows and windows[-1][1] == page - 1:
+            p0, p1, c0, c1 = windows[-1]
+            m0 = min(c0, first)
+            m1 = max(c1, last)
+            merged = (page - p0 + 1) * (m1 - m0 + 1)
+            separate = (p1 - p0 + 1) * (c1 - c0 + 1) + (last - first + 1) + _WINDOW_OVERHEAD
+            if merged <= separate:
+                windows[-1] = (p0, page, m0, m1)
+                continue
+
+        windows.append((page, page, first, last))
+
+    return windows
+
+
+# frames shared by every display of the same size
+frame_cache = FrameCache()
+
+
+def display_data(oled, text, data=False, cache=frame_cache):
+    size, _, _ = _layout(text, data)
+    key = (text, size, data, oled.width, oled.height)
+
+    frame = cache.get(key)
+    if frame is None:
+        frame = render_frame(oled.width, oled.height, text, data=data)
+        cache.put(key, frame)
+
+    # Copy the packed frame straight into the display's framebuffer
+    oled.buf[:] = frame
+
+
+class OledDisplay:
+    """Render-on-change wrapper around an :class:`adafruit_ssd1306.SSD1306_I2C`.
+
+    After the first full frame only the pages and column ranges that differ from the
+    frame last sent are written, using the controller's column and page addressing.
+
+    :param oled: The SSD1306 display to draw on.
+    :param FrameCache cache: Cache of rendered frames. Defaults to the shared :data:`frame_cache`"""
+
+    def __init__(self, oled, cache=frame_cache):
+        self.oled = oled
+        self.cache = cache
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+        self.windows_sent = 0
+        self._last_frame = None
+        self._sent = None
+
+        # windowed writes need the i2c device and horizontal addressing mode
+        self._partial = hasattr(oled, 'i2c_device') and not getattr(oled, 'page_addressing', False)
+
+    @property
+    def frame_bytes(self):
+        """Number of bytes pushed over i2c for a full frame"""
+        return self.oled.width * self.oled.height // 8
+
+    def show_text(self, text, data=False):
+        """Draw `text` and push it to the display, unless it is already showing.
+        Returns True if a frame was sent."""
+        frame = (text, data)
+        if frame == self._last_frame:
+            self.frames_skipped += 1
+            return False
+
+        display_data(self.oled, text, data=data, cache=self.cache)
+        self._push()
+
+        self._last_frame = frame
+        self.frames_sent += 1
+        return True
+
+    def _push(self):
+        """Send the framebuffer, limited to the regions that changed since the last push"""
+        oled = self.oled
+        frame = oled.buf
+
+        if self._sent is None or not self._partial:
+            oled.show()
+            self.bytes_sent += self.frame_bytes
+        else:
+            for window in dirty_windows(self._sent, frame, oled.width):
+                self.bytes_sent += self._write_window(*window)
+                self.windows_sent += 1
+
+        self._sent = bytes(frame)
+
+    def _write_window(self, first_page, last_page, first_col, last_col):
+        """Write one window of the framebuffer, returns the number of bytes sent"""
+        oled = self.oled
+        width = oled.width
+        # narrow displays use centered columns
+        col_offset = (128 - width) // 2 if width != 128 else 0
+
+        # Co=0, D/C=0: the rest of the transfer is a command stream
+        command = bytes((0x00,
+                         _SET_COL_ADDR, first_col + col_offset, last_col + col_offset,
+                         _SET_PAGE_ADDR, first_page, last_page))
+
+        # Co=0, D/C=1: the rest of the transfer is display data
+        data = bytearray(b'\x40')
+        for page in range(first_page, last_page + 1):
+            data += oled.buf[page * width + first_col:page * width + last_col + 1]
+
+        with oled.i2c_device:
+            oled.i2c_device.write(command)
+        with oled.i2c_device:
+            oled.i2c_device.write(data)
+
+        return len(command) + len(data)
+
+    def invalidate(self):
+        """Forget the last frame so that the next :meth:`show_text` redraws the whole display"""
+        self._last_frame = None
+        self._sent = None
+
+    def stats(self):
+        """Returns a dictionary with the frame and bus traffic counters"""
+        full = (self.frames_sent + self.frames_skipped) * self.frame_bytes
+        return {
+            "frames_sent": self.frames_sent,
+            "frames_skipped": self.frames_skipped,
+            "windows_sent": self.windows_sent,
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": full - self.bytes_sent,
+        }
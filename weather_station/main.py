@@ -1,26 +1,14 @@
-import os
 import time
-import subprocess
 
-import board
-import busio
-import RPi.GPIO as GPIO
+# start of the startup timing breakdown
+_start = time.perf_counter()
 
-import serial
-import pynmea2
+from contextlib import contextmanager
 
-from datetime import datetime
-import time
-from time import mktime
-
-from adafruit_bme680 import Adafruit_BME680_I2C
-from adafruit_ssd1306 import SSD1306_I2C
-from seeed_hm3301 import HM3301_I2C
-from seeed_air530 import GPS
-
-from PIL import Image
-from PIL import ImageDraw
-from PIL import ImageFont
+from scheduler import Scheduler
+from acquisition import BusWorker, Snapshot
+from busmanager import BusManager
+from display import OledDisplay, frame_cache
 
 OLED_WIDTH = 128
 OLED_HEIGHT = 64
@@ -30,23 +18,76 @@ rot_sw_pin = 'GPIO_PE6'
 rot_dt_pin = 'GPIO_PZ0'
 rot_clk_pin = 'CAM_AF_EN'
 
-display_item = 0
-item_length = 1
-sensor_data = ['Jetson\nWeather\nStation']
+data_names = ['UTC\n Date & Time', 'GPS\nCoordinates', 'Ambient\nTemperature', 'Ambient\nHumidity', 'Ambient\nAir Pressure', 'Ambient\nPM Values']
 
-read_interval = 0.05
+# snapshot reading and field shown on each data page
+data_sources = [('gps', 0), ('gps', 1), ('bme680', 0), ('bme680', 1), ('bme680', 2), ('hm3301', 0)]
+splash_text = 'Jetson\nWeather\nStation'
 
-last_acq = time.monotonic()
+display_item = 0
+item_length = len(data_names)
+
+# task cadences in seconds
+gps_interval = 0.1
+bme680_interval = 1.0
+hm3301_interval = 1.0
+oled_interval = 0.1
+
+# GPS attributes read by get_air530_data() and the fix rate in Hz
+gps_fields = ('has_fix', 'utc_epoch', 'latitude', 'longitude', 'altitude_m')
+gps_rate = 1
+# baud rate the GPS UART is switched to at startup, None stays at 9600. 10 Hz
+# fixes of every sentence need 115200
+gps_baudrate = None
+
+# fixes kept in the track history, one hour at 10 Hz, 0 to disable. Created by init()
+track_capacity = 36000
+track = None
+_last_fix = None
+
+# (UTC second, text) of the date page, only formatted again when the second changes
+_date_text = (None, None)
+
+# print the scheduler statistics every stats_interval seconds, 0 to disable
+stats_interval = 60
+
+# the render loop, the sensors run on one background worker per bus
+scheduler = Scheduler()
+snapshot = Snapshot()
+
+# transaction queues of the i2c buses, created by init()
+buses = []
+
+# bus clock rate of i2c1, where both displays live
+i2c1_clk_rate = 1000000
+i2c1_clk_path = '/sys/bus/i2c/devices/i2c-1/bus_clk_rate'
+
+# (step, seconds) timings of the startup
+startup_times = [('imports', time.perf_counter() - _start)]
+
+@contextmanager
+def startup_step(name):
+    # time a startup step for the breakdown printed once the first frame is up
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_times.append((name, time.perf_counter() - start))
 
-# Set default font dor OLED Displays
-fwd = os.path.dirname(os.path.abspath(__file__))
-font_default = ImageFont.truetype(fwd + '/fonts/Oswald-Medium.ttf', 16)
-font_big = ImageFont.truetype(fwd + '/fonts/Oswald-Medium.ttf', 24)
-font_huge = ImageFont.truetype(fwd + '/fonts/Oswald-Medium.ttf', 30)
+def print_startup():
+    total = time.perf_counter() - _start
+    print(f'startup: {1000 * total:.0f} ms to first frame')
+    for name, seconds in startup_times:
+        print(f'  {name:<12} {1000 * seconds:8.1f} ms')
 
 class rotary_encoder:
 
-    def __init__(self, sw_pin=rot_sw_pin, dt_pin=rot_dt_pin, clk_pin=rot_clk_pin):
+    def __init__(self, sw_pin=rot_sw_pin, dt_pin=rot_dt_pin, clk_pin=rot_clk_pin, on_turn=None):
+        import RPi.GPIO as GPIO  # pylint: disable=import-outside-toplevel
+
+        # called from the GPIO thread after every page change
+        self.on_turn = on_turn
+
         # pin setup
         #GPIO.setmode(GPIO.TEGRA_SOC)  # BOARD pin-numbering scheme
         GPIO.setup([sw_pin, dt_pin, clk_pin], GPIO.IN)  #rotary encoder pins set as inputs
@@ -92,62 +133,123 @@ class rotary_encoder:
         self.clk_int = False
         self.dt_int = False
 
-def init():
-    # change the i2c1 bus frequency to 1 MHz
-    subprocess.call('sudo sh -c "echo 1000000 > /sys/bus/i2c/devices/i2c-1/bus_clk_rate"', shell=True)
+        if self.on_turn is not None:
+            self.on_turn()
 
-    #  initiialise buses
-    # I2C Buses
-    i2c0_bus = busio.I2C(board.SCL_1, board.SDA_1, frequency=100000)
-    i2c1_bus = busio.I2C(board.SCL, board.SDA, frequency=1000000)
+def page_changed():
+    # show the new page straight away
+    scheduler.trigger('oled1')
+    scheduler.trigger('oled2')
 
-    # GPS is connected to TX1 and RX1 on Jetson Nano
-    port = '/dev/ttyTHS1'
-    # initialise the serial port with a baudrate of 9600
-    uart = serial.Serial(port, baudrate=9600, timeout=30)
-    
-    # initialise sensors
-    air530 = GPS(uart, debug=False)
-    
-    bme680 = Adafruit_BME680_I2C(i2c0_bus, address=0x76)
-    bme680.sea_level_pressure = 1013.25
-   
-    hm3301 = HM3301_I2C(i2c0_bus, address=0x40)
-
-    rot_enc = rotary_encoder()
-
-    oled1 = SSD1306_I2C(OLED_WIDTH, OLED_HEIGHT, i2c1_bus, addr=0x3c)
-    oled1.fill(0)
-    oled1.show()
-
-    oled2 = SSD1306_I2C(OLED_WIDTH, OLED_HEIGHT, i2c1_bus, addr=0x3d)
-    oled2.fill(0)
-    oled2.show()
+def configure_bus_clock(path, rate):
+    # set the i2c bus frequency through sysfs, returns True if the bus runs at rate
+    try:
+        with open(path) as f:
+            if int(f.read()) == rate:
+                return True
+
+        with open(path, 'w') as f:
+            f.write(str(rate))
+
+        with open(path) as f:
+            current = int(f.read())
+    except (OSError, ValueError) as error:
+        print(f'Could not set {path} to {rate}: {error}')
+        print(f'Run as root or add a udev rule granting write access to {path}')
+        return False
+
+    if current != rate:
+        print(f'{path} is {current} after writing {rate}')
+        return False
+
+    return True
+
+def init(on_turn=page_changed, threaded=True, clk_path=i2c1_clk_path):
+    # the hardware libraries are only imported when the station actually starts.
+    # threaded=False builds the same peripherals without any background thread: the
+    # drivers talk to the buses directly and the GPS UART is read in bulk by update().
+    # clk_path is the sysfs file of the i2c1 bus clock
+    # pylint: disable=import-outside-toplevel
+    global track
+
+    with startup_step('hw imports'):
+        import board
+        import busio
+        import serial
+
+        from seeed_bme680 import Adafruit_BME680_I2C
+        from adafruit_ssd1306 import SSD1306_I2C
+        from seeed_hm3301 import HM3301_I2C
+        from seeed_air530 import GPS
+
+    with startup_step('bus clock'):
+        # change the i2c1 bus frequency to 1 MHz
+        configure_bus_clock(clk_path, i2c1_clk_rate)
 
-    return [air530, bme680, hm3301, rotary_encoder],  [oled1, oled2]
+    #  initiialise buses
+    # I2C Buses
+    with startup_step('buses'):
+        i2c0 = busio.I2C(board.SCL_1, board.SDA_1, frequency=100000)
+        i2c1 = busio.I2C(board.SCL, board.SDA, frequency=i2c1_clk_rate)
+        if threaded:
+            # every driver submits its transfers to the bus manager, which orders them fairly,
+            # merges the BME680 register writes and tracks the bus utilisation
+            i2c0 = BusManager(i2c0, name='i2c0', coalesce=(0x76,))
+            i2c1 = BusManager(i2c1, name='i2c1')
+            buses[:] = [i2c0, i2c1]
+
+    def client(bus):
+        # every driver gets its own client of a managed bus
+        return bus.client() if threaded else bus
+
+    with startup_step('oleds'):
+        oled1 = SSD1306_I2C(OLED_WIDTH, OLED_HEIGHT, client(i2c1), addr=0x3c)
+        oled2 = SSD1306_I2C(OLED_WIDTH, OLED_HEIGHT, client(i2c1), addr=0x3d)
+
+    with startup_step('gps'):
+        # GPS is connected to TX1 and RX1 on Jetson Nano
+        port = '/dev/ttyTHS1'
+        # initialise the serial port with a baudrate of 9600
+        uart = serial.Serial(port, baudrate=9600, timeout=30)
+
+        # initialise sensors
+        air530 = GPS(uart, debug=False, bulk_read=not threaded)
+        if gps_baudrate and air530.negotiate_baudrate((gps_baudrate,)) != gps_baudrate:
+            print(f'GPS stayed at {uart.baudrate} baud, {gps_baudrate} did not work')
+        # only have the module send the sentences behind the fields the station reads
+        if not air530.configure(gps_fields, rate=gps_rate, timeout=0.5):
+            print(f'GPS did not acknowledge the output configuration for {gps_fields}')
+        if threaded:
+            # drain the UART in the background so bursts are never lost while rendering
+            air530.start_reader()
+
+    if track_capacity:
+        with startup_step('track'):
+            from track import Track
+            track = Track(track_capacity)
+
+    with startup_step('bme680'):
+        bme680 = Adafruit_BME680_I2C(client(i2c0), address=0x76)
+        bme680.sea_level_pressure = 1013.25
+
+    with startup_step('hm3301'):
+        hm3301 = HM3301_I2C(client(i2c0), address=0x40)
+
+    with startup_step('rotary'):
+        rot_enc = rotary_encoder(on_turn=on_turn)
+
+    return [air530, bme680, hm3301, rot_enc],  [OledDisplay(oled1), OledDisplay(oled2)]
 
 def get_air530_data(air530):
 
-    latitude = None
-    longitude = None
-    altitude = None
-    date_time = None
-
-    #air530.update()
-
     if not air530.has_fix:
         retval = ['No Fix', 'No Fix'] 
     else:
-        UTC_time = air530.timestamp_utc
-        if UTC_time[0] != 0:
-            UTC_datetime = datetime.fromtimestamp(mktime(UTC_time))
-            retval_date = UTC_datetime.strftime('%d-%b-%Y\n%H-%M-%S')
+        UTC_epoch = air530.utc_epoch
+        if UTC_epoch is not None:
+            retval_date = format_utc(UTC_epoch)
 
-            latitude = air530.latitude
-            longitude = air530.longitude
-            altitude = air530.altitude_m
-
-            retval_loc = f'Lat: {latitude:.4f}\nLon: {longitude:.4f}'
+            retval_loc = f'Lat: {air530.latitude:.4f}\nLon: {air530.longitude:.4f}'
 
             retval = [retval_date, retval_loc] 
         
@@ -156,13 +258,21 @@ def get_air530_data(air530):
 
     return retval
 
+def format_utc(epoch):
+    # date page text of a UTC epoch second, formatted once per second
+    global _date_text
+
+    if _date_text[0] != epoch:
+        _date_text = (epoch, time.strftime('%d-%b-%Y\n%H-%M-%S', time.gmtime(epoch)))
+    return _date_text[1]
+
 def get_hm3301_data(hm3301):
     # acquire the data
     try:
-        PM_std = hm3301.get_std_readings()
-        retval = [f'PM1.0: {PM_std[0]}ug/m3\nPM2.5: {PM_std[1]}ug/m3\nPM10: {PM_std[2]}ug/m3']
+        reading = hm3301.read()
+        retval = [f'PM1.0: {reading.pm1_0_std}ug/m3\nPM2.5: {reading.pm2_5_std}ug/m3\nPM10: {reading.pm10_std}ug/m3']
 
-    except:
+    except (OSError, RuntimeError):
         retval = ['Read\nError']
 
     return retval
@@ -171,83 +281,128 @@ def get_bme680_data(bme680):
     # acquire the data
 
     try:
-        temp = bme680.temperature
-        humd = bme680.relative_humidity
-        pres = bme680.pressure
-        #gas =  bme680.gas
+        # every channel from the same measurement, the one already started if any
+        reading = bme680.wait_result() if bme680.measuring else bme680.read()
 
-        retval = [f'{temp:.1f}°C', f'{humd:.1f} %', f'{pres:.0f} hPa']
+        retval = [f'{reading.temperature:.1f}°C', f'{reading.humidity:.1f} %', f'{reading.pressure:.0f} hPa']
 
-    except:
+    except (OSError, RuntimeError):
         retval = ['Read\nError', 'Read\nError', 'Read\nError']
 
     return retval
 
 
-def display_data(oled, text, data=False):
-    # create a blank image on which the text will be placed
-    image = Image.new('1', (oled.width, oled.height))
-    draw = ImageDraw.Draw(image)
+def poll_air530(air530):
+    # parse every sentence the reader buffered since the last poll
+    air530.update()
 
-    # Draw a black filled box to clear the image.
-    draw.rectangle((0, 0, oled.width, oled.height), outline=0, fill=0)
+    if track is not None and air530.has_fix:
+        record_fix(air530)
 
-    # First define some constants to allow easy resizing of shapes.
-    padding = -2
-    top = padding
-    bottom = oled.height-padding
-    
-    # parse the text
-    items = text.split('\n')
-  
-    if data: 
-        for i, item in enumerate(items):
-            if len(items) == 1:
-                w, h = draw.textsize(item, font_huge)
-                draw.text(((oled.width-w)/2+2, top+15+(i*25)), item, font=font_huge, fill=255)
-            elif len(items) == 2:
-                w, h = draw.textsize(item, font_big)
-                draw.text(((oled.width-w)/2+2, top+5+(i*23)), item, font=font_big, fill=255)
-            else:
-                w, h = draw.textsize(item, font_default)
-                draw.text(((oled.width-w)/2+2, top+3+(i*20)), item, font=font_default, fill=255)
+    return tuple(get_air530_data(air530))
+
+def record_fix(air530):
+    # append the current fix to the track history unless it was already recorded
+    global _last_fix
+
+    fix = (air530.fix_anchor, air530.latitude, air530.longitude)
+    if fix == _last_fix or air530.latitude is None or air530.longitude is None:
+        return
+    _last_fix = fix
+
+    # stamped with the time the fix arrived rather than the time it was polled, every
+    # fix of a second has its own time at rates above 1 Hz
+    monotonic = air530.fix_anchor if air530.fix_anchor is not None else time.monotonic()
+    track.append(monotonic, air530.latitude, air530.longitude, air530.altitude_m,
+                 air530.utc_now(monotonic))
+
+def page_text(item):
+    # latest published text of a data page
+    name, field = data_sources[item]
+    reading = snapshot.get(name)
+    if reading is None or reading.value is None:
+        return splash_text
+
+    return reading.value[field]
+
+def refresh_oled(oled, data=False):
+    # only redraws and pushes the frame if its content changed
+    if data:
+        oled.show_text(page_text(display_item), data=True)
     else:
-        for i, item in enumerate(items):
-            w, h = draw.textsize(item, font_big)
-            draw.text(((oled.width-w)/2+2, top+5+(i*23)), item, font=font_big, fill=255)
+        oled.show_text(data_names[display_item], data=False)
 
-    
-    # Display the image.
-    oled.image(image)
-    #oled.show()
+def start_workers(sensors):
+    # one worker per bus, each publishing immutable readings into the snapshot
+    air530, bme680, hm3301 = sensors[:3]
 
-################################################################################################################################
+    uart_worker = BusWorker('uart', snapshot)
+    uart_worker.add('gps', lambda: poll_air530(air530), gps_interval)
 
-sensors, oleds = init()
-data_names = ['UTC\n Date & Time', 'GPS\nCoordinates', 'Ambient\nTemperature', 'Ambient\nHumidity', 'Ambient\nAir Pressure', 'Ambient\nPM Values']
+    i2c0_worker = BusWorker('i2c0', snapshot)
+    # trigger the BME680 and collect it one conversion time later, the HM3301 can
+    # use the bus in between
+    i2c0_worker.scheduler.add('bme680 trigger', bme680.start_measurement, bme680_interval)
+    i2c0_worker.add('bme680', lambda: tuple(get_bme680_data(bme680)), bme680_interval,
+                    delay=bme680.measurement_time)
+    i2c0_worker.add('hm3301', lambda: tuple(get_hm3301_data(hm3301)), hm3301_interval)
 
-while True:
-    
-    current = time.monotonic()
-    sensors[0].update()
+    workers = [uart_worker, i2c0_worker]
+    for worker in workers:
+        worker.start()
 
-    if current - last_acq >= read_interval:
-        last_acq = current
+    return workers
 
-        sensor_data = []
+def report(oleds, workers):
+    print('[i2c1]')
+    scheduler.report()
 
-        sensor_data.extend(get_air530_data(sensors[0]))
-        sensor_data.extend(get_bme680_data(sensors[1]))
-        sensor_data.extend(get_hm3301_data(sensors[2]))
+    for worker in workers:
+        worker.report()
 
-        item_length = len(sensor_data)
-    
-        #print(sensor_data)
+    for bus in buses:
+        bus.report()
 
-    display_data(oleds[0], data_names[display_item], data=False)
-    display_data(oleds[1], sensor_data[display_item], data=True)
-    
-    oleds[0].show()
-    oleds[1].show()
+    for i, oled in enumerate(oleds):
+        stats = oled.stats()
+        print(f"oled{i + 1}: {stats['frames_sent']} frames sent, {stats['frames_skipped']} skipped, "
+              f"{stats['bytes_saved']} bytes saved")
+
+    if track is not None and len(track):
+        summary = track.summary(3600)
+        print(f"track: {summary['fixes']} fixes in the last hour, {summary['distance_m'] / 1000:.2f} km "
+              f"in {summary['duration_s'] / 60:.1f} min")
+
+    stats = frame_cache.stats()
+    print(f"frame cache: {stats['entries']} frames ({stats['bytes']} bytes), {stats['hits']} hits, "
+          f"{stats['misses']} misses, {stats['evictions']} evictions")
+
+################################################################################################################################
 
+def main():
+    sensors, oleds = init()
 
+    with startup_step('first frame'):
+        # the splash screen goes up before the sensors are polled
+        refresh_oled(oleds[0])
+        refresh_oled(oleds[1], data=True)
+    print_startup()
+
+    workers = start_workers(sensors)
+
+    # the displays run at their own cadence, the loop sleeps until the next deadline
+    scheduler.add('oled1', lambda: refresh_oled(oleds[0]), oled_interval)
+    scheduler.add('oled2', lambda: refresh_oled(oleds[1], data=True), oled_interval)
+
+    if stats_interval:
+        scheduler.add('stats', lambda: report(oleds, workers), stats_interval, delay=stats_interval)
+
+    try:
+        scheduler.run()
+    finally:
+        for worker in workers:
+            worker.stop(timeout=1)
+        report(oleds, workers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+asyncio entry point for the weather station.
+
+Runs the same peripherals as main.py as coroutines on a single event loop:
+the Air530, BME680 and HM3301 reads, the rotary encoder events and the two
+OLED refreshes. The peripherals are built without the background threads of
+main.py: the GPS UART is read in bulk from a coroutine and the drivers talk to
+the buses directly, without the bus manager queues. Blocking bus calls go to a
+single thread executor per bus, so transactions on one bus stay serialised while
+the loop keeps running. Other consumers (logging, a local API...) can be added as
+coroutines reading the shared snapshot.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main as station
+from scheduler import Task, print_stats
+
+# per-thread CPU clock, falls back to the process clock on python < 3.7
+_cpu_clock = getattr(time, "thread_time", time.process_time)
+
+tasks = []
+
+
+def _timed(task, func, *args):
+    # run func, adding the CPU time it used to the task
+    start = _cpu_clock()
+    try:
+        return func(*args)
+    finally:
+        task.cpu_time += _cpu_clock() - start
+
+
+async def periodic(name, interval, func, *args, executor=None, delay=0.0):
+    """Call `func(*args)` every `interval` seconds, first `delay` seconds from now, in
+    `executor` if given. Returns once the task is cancelled."""
+    loop = asyncio.get_running_loop()
+    task = Task(name, func, interval)
+    tasks.append(task)
+
+    release = loop.time() + delay
+    await asyncio.sleep(delay)
+    while True:
+        try:
+            if executor is None:
+                _timed(task, func, *args)
+            else:
+                await loop.run_in_executor(executor, _timed, task, func, *args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:  # pylint: disable=broad-except
+            task.errors += 1
+            print("Task '%s' failed: %r" % (name, error))
+
+        end = loop.time()
+        latency = end - release
+        task.runs += 1
+        task.max_latency = max(task.max_latency, latency)
+        if latency > task.deadline:
+            task.missed += 1
+
+        # keep the task in phase, dropping the periods it overran
+        release += interval
+        if release <= end:
+            periods = int((end - release) // interval) + 1
+            task.skipped += periods
+            release += periods * interval
+
+        await asyncio.sleep(release - end)
+
+
+async def acquire(name, interval, read, executor=None, delay=0.0):
+    """Publish the value returned by `read` into the snapshot every `interval` seconds, read
+    in `executor` if given"""
+    def publish():
+        try:
+            value = read()
+        except Exception as error:  # pylint: disable=broad-except
+            station.snapshot.publish(name, None, error=error)
+            raise
+        station.snapshot.publish(name, value)
+
+    await periodic(name, interval, publish, executor=executor, delay=delay)
+
+
+async def rotary_events(page_event, oleds, executor):
+    """Redraw both displays as soon as the rotary encoder changes the page"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await page_event.wait()
+        page_event.clear()
+        await loop.run_in_executor(executor, station.refresh_oled, oleds[0])
+        await loop.run_in_executor(executor, station.refresh_oled, oleds[1], True)
+
+
+async def report(oleds, started):
+    """Print the task statistics every `station.stats_interval` seconds"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(station.stats_interval)
+        print_stats(tasks, loop.time() - started)
+        for i, oled in enumerate(oleds):
+            stats = oled.stats()
+            print(f"oled{i + 1}: {stats['frames_sent']} frames sent, {stats['frames_skipped']} skipped, "
+                  f"{stats['bytes_saved']} bytes saved")
+
+
+async def main():
+    loop = asyncio.get_running_loop()
+    page_event = asyncio.Event()
+
+    # the GPIO interrupts run on their own thread, nothing else does: no UART reader
+    # and no bus manager queues
+    sensors, oleds = station.init(on_turn=lambda: loop.call_soon_threadsafe(page_event.set),
+                                  threaded=False)
+    air530, bme680, hm3301 = sensors[:3]
+
+    # one single thread executor per bus keeps its transactions serialised
+    i2c0 = ThreadPoolExecutor(max_workers=1)
+    i2c1 = ThreadPoolExecutor(max_workers=1)
+
+    coroutines = [
+        # bulk reads only take what the UART already holds, they never block the loop
+        acquire('gps', station.gps_interval, lambda: station.poll_air530(air530)),
+        # the BME680 converts between its trigger and collect, leaving i2c0 to the HM3301
+        periodic('bme680 trigger', station.bme680_interval, bme680.start_measurement, executor=i2c0),
+        acquire('bme680', station.bme680_interval, lambda: tuple(station.get_bme680_data(bme680)), i2c0,
+                delay=bme680.measurement_time),
+        acquire('hm3301', station.hm3301_interval, lambda: tuple(station.get_hm3301_data(hm3301)), i2c0),
+        periodic('oled1', station.oled_interval, station.refresh_oled, oleds[0], executor=i2c1),
+        periodic('oled2', station.oled_interval, station.refresh_oled, oleds[1], True, executor=i2c1),
+        rotary_events(page_event, oleds, i2c1),
+    ]
+    if station.stats_interval:
+        coroutines.append(report(oleds, loop.time()))
+
+    started = loop.time()
+    try:
+        await asyncio.gather(*coroutines)
+    finally:
+        # cancelled by asyncio.run() on Ctrl-C, let the bus calls in flight finish
+        for executor in (i2c0, i2c1):
+            executor.shutdown(wait=True)
+        print_stats(tasks, loop.time() - started)
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,505 @@
+"""
+`nmea_replay`
+================================================================================
+
+Replays archived NMEA logs through the station's :mod:`seeed_air530` parser and
+summarises the receiver performance: time to first fix, fix availability, DOP
+and SNR distributions and the scatter of the reported positions.
+
+Files are cut into chunks on line boundaries and parsed by a pool of worker
+processes. Every worker streams its chunk in fixed size blocks and returns
+fixed size statistics (counters, histograms with fixed bins and running
+moments), which are merged as they arrive, so memory use does not depend on
+the size of the logs:
+
+    python nmea_replay.py /var/log/station/nmea --jobs 4 --json summary.json
+"""
+
+import argparse
+import fnmatch
+import gzip
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from seeed_air530 import GPS
+from track import EARTH_RADIUS
+
+# sentence types the statistics are computed from
+SENTENCES = ('GGA', 'GSA', 'GSV', 'RMC', 'ZDA')
+
+# bytes read from a file at once, and the size of the chunks handed to the workers
+BLOCK_SIZE = 1 << 20
+CHUNK_SIZE = 64 << 20
+
+
+class Histogram:
+    """Histogram with `bins` equal bins between `low` and `high`, plus an underflow
+    and an overflow bin. Histograms with the same bins merge by adding their counts.
+
+    :param float low: Lower edge of the first bin.
+    :param float high: Upper edge of the last bin.
+    :param int bins: Number of bins."""
+
+    def __init__(self, low, high, bins):
+        self.low = low
+        self.high = high
+        self.bins = bins
+        self._scale = bins / (high - low)
+        self.counts = [0] * (bins + 2)
+        self.total = 0.0
+        self.maximum = None
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def add(self, value):
+        index = int((value - self.low) * self._scale) + 1
+        if index < 0:
+            index = 0
+        elif index > self.bins:
+            index = self.bins + 1
+        self.counts[index] += 1
+        self.total += value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        if other.maximum is not None and (self.maximum is None or other.maximum > self.maximum):
+            self.maximum = other.maximum
+
+    def percentile(self, fraction):
+        """Returns the upper edge of the bin holding the `fraction` quantile, at most the
+        largest value added, None if empty"""
+        count = len(self)
+        if not count:
+            return None
+        rank = fraction * count
+        seen = 0
+        for index, bin_count in enumerate(self.counts):
+            seen += bin_count
+            if seen >= rank and bin_count:
+                if index > self.bins:
+                    return self.maximum
+                return min(self.low + index / self._scale, self.maximum)
+        return self.maximum
+
+    def summary(self):
+        """Returns a dictionary with the count, mean, p10, p50, p90, p99 and maximum"""
+        count = len(self)
+        return {
+            'count': count,
+            'mean': self.total / count if count else None,
+            'p10': self.percentile(0.10),
+            'p50': self.percentile(0.50),
+            'p90': self.percentile(0.90),
+            'p99': self.percentile(0.99),
+            'max': self.maximum,
+        }
+
+
+class Moments:
+    """Running count, mean and sum of squared deviations of a value (Welford), mergeable
+    across workers (Chan et al.)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def merge(self, other):
+        if not other.count:
+            return
+        if not self.count:
+            self.__dict__.update(other.__dict__)
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class ReplayStats:
+    """Statistics of a replayed chunk or, once merged, of every chunk"""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.lines = 0
+        self.sentences = 0
+        self.epochs = 0
+        self.fixed_epochs = 0
+        self.fix_losses = 0
+        # file -> (chunk start, first epoch, first fixed epoch) of each of its chunks, as
+        # seconds of the day or None, the time to first fix is worked out once merged
+        self.first_fixes = {}
+        self.dop = {name: Histogram(0.0, 20.0, 200) for name in ('hdop', 'pdop', 'vdop')}
+        # talker (b"GP"...) -> histogram of the satellite signal-to-noise ratios in dB
+        self.snr = {}
+        self.satellites = Histogram(0, 40, 40)
+        self.latitude = Moments()
+        self.longitude = Moments()
+        self.altitude = Moments()
+
+    def merge(self, other):
+        for name in ('files', 'bytes', 'lines', 'sentences', 'epochs', 'fixed_epochs', 'fix_losses'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for path, chunks in other.first_fixes.items():
+            self.first_fixes.setdefault(path, []).extend(chunks)
+        for name, histogram in other.dop.items():
+            self.dop[name].merge(histogram)
+        for talker, histogram in other.snr.items():
+            if talker in self.snr:
+                self.snr[talker].merge(histogram)
+            else:
+                self.snr[talker] = histogram
+        self.satellites.merge(other.satellites)
+        self.latitude.merge(other.latitude)
+        self.longitude.merge(other.longitude)
+        self.altitude.merge(other.altitude)
+
+    def time_to_first_fix(self):
+        """Returns the seconds from the first epoch to the first fix of every file, None for
+        the files that never got a fix"""
+        first_fixes = {}
+        for path, chunks in self.first_fixes.items():
+            first_epoch = first_fix = None
+            for _, epoch, fix in sorted(chunks, key=lambda chunk: chunk[0]):
+                if first_epoch is None:
+                    first_epoch = epoch
+                if fix is not None:
+                    first_fix = fix
+                    break
+            if first_epoch is None or first_fix is None:
+                first_fixes[path] = None
+            else:
+                # across midnight
+                first_fixes[path] = (first_fix - first_epoch) % 86400
+        return first_fixes
+
+    def summary(self):
+        """Returns the statistics as a JSON serialisable dictionary"""
+        lat, lon = self.latitude, self.longitude
+        scatter = None
+        if lat.count:
+            # standard deviations in meters to the north and east of the mean position
+            north = math.radians(lat.std) * EARTH_RADIUS
+            east = math.radians(lon.std) * EARTH_RADIUS * math.cos(math.radians(lat.mean))
+            scatter = {
+                'fixes': lat.count,
+                'mean': (lat.mean, lon.mean),
+                'std_north_m': north,
+                'std_east_m': east,
+                'drms2_m': 2 * math.sqrt(north * north + east * east),
+                'bbox': (lat.minimum, lon.minimum, lat.maximum, lon.maximum),
+                'altitude_m': {
+                    'mean': self.altitude.mean if self.altitude.count else None,
+                    'std': self.altitude.std,
+                    'min': self.altitude.minimum,
+                    'max': self.altitude.maximum,
+                },
+            }
+
+        first_fixes = self.time_to_first_fix()
+        ttffs = [seconds for seconds in first_fixes.values() if seconds is not None]
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'lines': self.lines,
+            'sentences': self.sentences,
+            'rejected_lines': self.lines - self.sentences,
+            'epochs': self.epochs,
+            'fixed_epochs': self.fixed_epochs,
+            'fix_availability': self.fixed_epochs / self.epochs if self.epochs else None,
+            'fix_losses': self.fix_losses,
+            'time_to_first_fix_s': {
+                'files': first_fixes,
+                'min': min(ttffs) if ttffs else None,
+                'mean': sum(ttffs) / len(ttffs) if ttffs else None,
+                'max': max(ttffs) if ttffs else None,
+            },
+            'dop': {name: histogram.summary() for name, histogram in self.dop.items()},
+            'snr_db': {talker.decode('ascii'): histogram.summary()
+                       for talker, histogram in sorted(self.snr.items())},
+            'satellites_used': self.satellites.summary(),
+            'position': scatter,
+        }
+
+
+def _seconds_of_day(time_utc):
+    # seconds since midnight of a hhmmss time
+    return 3600 * (time_utc // 10000) + 60 * ((time_utc // 100) % 100) + time_utc % 100
+
+
+class _ReplayGPS(GPS):
+    """GPS parser recording the statistics of every GGA, GSA and GSV it parses"""
+
+    def __init__(self, stats, sentences=SENTENCES):
+        super().__init__(None, sentences=sentences)
+        self.stats = stats
+        # seconds of the day of the first epoch and of the first fixed epoch of the chunk
+        self.first_epoch = None
+        self.first_fix = None
+        self._fixed = False
+
+    def _parse_gga(self, data):
+        if super()._parse_gga(data):
+            fixed = self.fix_quality is not None and self.fix_quality >= 1
+            seconds = _seconds_of_day(self._time_utc)
+        elif data is not None and len(data) == 14 and data[5] in (b"0", b""):
+            # the parser rejects the empty position fields of an epoch without a fix
+            fixed = False
+            try:
+                seconds = _seconds_of_day(int(float(data[0])))
+            except ValueError:
+                seconds = None
+        else:
+            return False
+
+        stats = self.stats
+        stats.epochs += 1
+
+        if seconds is not None:
+            if self.first_epoch is None:
+                self.first_epoch = seconds
+            if fixed and self.first_fix is None:
+                self.first_fix = seconds
+
+        if fixed:
+            stats.fixed_epochs += 1
+            if self.horizontal_dilution is not None:
+                stats.dop['hdop'].add(self.horizontal_dilution)
+            if self.satellites is not None:
+                stats.satellites.add(self.satellites)
+            if self.latitude is not None and self.longitude is not None:
+                stats.latitude.add(self.latitude)
+                stats.longitude.add(self.longitude)
+            if self.altitude_m is not None:
+                stats.altitude.add(self.altitude_m)
+        elif self._fixed:
+            stats.fix_losses += 1
+        self._fixed = fixed
+
+        return True
+
+    def _parse_gsa(self, talker, data):
+        if not super()._parse_gsa(talker, data):
+            return False
+
+        if self.fix_quality_3d is not None and self.fix_quality_3d >= 2:
+            dop = self.stats.dop
+            if self.pdop is not None:
+                dop['pdop'].add(self.pdop)
+            if self.vdop is not None:
+                dop['vdop'].add(self.vdop)
+        return True
+
+    def _parse_gsv(self, talker, data):
+        if not super()._parse_gsv(talker, data):
+            return False
+
+        # the signal-to-noise ratio closes each block of four satellite fields
+        histogram = None
+        for index in range(6, len(data), 4):
+            snr = data[index]
+            if snr:
+                if histogram is None:
+                    histogram = self.stats.snr.get(talker)
+                    if histogram is None:
+                        histogram = self.stats.snr[talker] = Histogram(0, 60, 60)
+                histogram.add(int(snr))
+        return True
+
+
+def replay_chunk(chunk):
+    """Parse the lines starting between the `start` and `end` offsets of a file. A line
+    belongs to the chunk it starts in. Returns the :class:`ReplayStats` of the chunk."""
+    path, start, end = chunk
+    stats = ReplayStats()
+    gps = _ReplayGPS(stats)
+
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        if start:
+            # skip the rest of the line started in the previous chunk
+            f.seek(start - 1)
+            f.readline()
+        remaining = None if end is None else end - f.tell()
+
+        while remaining is None or remaining > 0:
+            block = f.read(BLOCK_SIZE if remaining is None else min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            if remaining is not None:
+                remaining -= len(block)
+                if remaining <= 0 and not block.endswith(b'\n'):
+                    # finish the last line, it started in this chunk
+                    block += f.readline()
+            stats.bytes += len(block)
+            gps.feed(block)
+        gps.feed(b'\n')
+
+    if start == 0:
+        stats.files = 1
+    stats.first_fixes[path] = [(start, gps.first_epoch, gps.first_fix)]
+    stats.lines = gps.lines_received
+    stats.sentences = gps.sentences_parsed
+    return stats
+
+
+def find_logs(paths, pattern='*'):
+    """Returns the files given in `paths`, walking directories for files matching `pattern`"""
+    logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                logs.extend(os.path.join(root, name) for name in sorted(files)
+                            if fnmatch.fnmatch(name, pattern))
+        else:
+            logs.append(path)
+    return logs
+
+
+def make_chunks(logs, chunk_size=CHUNK_SIZE):
+    """Returns the (path, start, end) chunks of the logs, compressed logs are not split"""
+    chunks = []
+    for path in logs:
+        if path.endswith('.gz'):
+            chunks.append((path, 0, None))
+            continue
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), chunk_size):
+            chunks.append((path, start, min(start + chunk_size, size)))
+    return chunks
+
+
+def replay(logs, jobs=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Replay every chunk of `logs` on `jobs` processes. Returns the merged :class:`ReplayStats`"""
+    stats = ReplayStats()
+    chunks = make_chunks(logs, chunk_size)
+
+    if jobs == 1:
+        for chunk in chunks:
+            stats.merge(replay_chunk(chunk))
+            if progress is not None:
+                progress(stats)
+        return stats
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for future in as_completed([pool.submit(replay_chunk, chunk) for chunk in chunks]):
+            stats.merge(future.result())
+            if progress is not None:
+                progress(stats)
+    return stats
+
+
+def _fmt(value, digits=1):
+    if value is None:
+        return '-'
+    return f'{value:.{digits}f}'
+
+
+def print_summary(summary, out=sys.stdout):
+    """Print the summary as plain text tables"""
+    run = summary['run']
+    print(f"{summary['files']} files, {summary['bytes'] / 1e6:.1f} MB, {summary['sentences']} sentences "
+          f"({summary['rejected_lines']} lines rejected) in {run['elapsed_s']:.2f} s: "
+          f"{run['sentences_per_second']:.0f} sentences/s, {run['mb_per_second']:.1f} MB/s", file=out)
+
+    availability = summary['fix_availability']
+    print(f"fix: {summary['fixed_epochs']} of {summary['epochs']} epochs "
+          f"({_fmt(None if availability is None else 100 * availability)}%), "
+          f"{summary['fix_losses']} losses", file=out)
+
+    ttff = summary['time_to_first_fix_s']
+    print(f"time to first fix: min {_fmt(ttff['min'], 0)} s, mean {_fmt(ttff['mean'], 0)} s, "
+          f"max {_fmt(ttff['max'], 0)} s, "
+          f"{sum(1 for seconds in ttff['files'].values() if seconds is None)} files without a fix", file=out)
+
+    print(file=out)
+    print(f"{'':<10}{'count':>10}{'mean':>8}{'p10':>8}{'p50':>8}{'p90':>8}{'p99':>8}{'max':>8}", file=out)
+    rows = [(name.upper(), hist) for name, hist in summary['dop'].items()]
+    rows += [(f'SNR {talker}', hist) for talker, hist in summary['snr_db'].items()]
+    rows.append(('sats used', summary['satellites_used']))
+    for name, hist in rows:
+        print(f"{name:<10}{hist['count']:>10}" + ''.join(
+            f"{_fmt(hist[key]):>8}" for key in ('mean', 'p10', 'p50', 'p90', 'p99', 'max')), file=out)
+
+    position = summary['position']
+    if position is not None:
+        lat, lon = position['mean']
+        print(file=out)
+        print(f"position: {lat:.6f}, {lon:.6f} from {position['fixes']} fixes, "
+              f"std {position['std_north_m']:.1f} m north {position['std_east_m']:.1f} m east, "
+              f"2DRMS {position['drms2_m']:.1f} m", file=out)
+        altitude = position['altitude_m']
+        print(f"altitude: mean {_fmt(altitude['mean'])} m, std {_fmt(altitude['std'])} m, "
+              f"{_fmt(altitude['min'])} to {_fmt(altitude['max'])} m", file=out)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1].strip().replace('\n', ' '))
+    parser.add_argument('paths', nargs='+', help='NMEA log files or directories of them')
+    parser.add_argument('--pattern', default='*',
+                        help='file name pattern of the logs in directories (default: %(default)s)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunk-mb', type=float, default=CHUNK_SIZE >> 20,
+                        help='size of the pieces large files are cut into (default: %(default)s)')
+    parser.add_argument('--json', help='also write the summary to this file as JSON')
+    parser.add_argument('--quiet', action='store_true', help='do not print the summary tables')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logs = find_logs(args.paths, args.pattern)
+    if not logs:
+        sys.exit('No NMEA logs found')
+
+    start = time.perf_counter()
+    stats = replay(logs, jobs=args.jobs, chunk_size=max(1, int(args.chunk_mb * (1 << 20))))
+    elapsed = time.perf_counter() - start
+
+    summary = stats.summary()
+    summary['run'] = {
+        'jobs': args.jobs or os.cpu_count(),
+        'elapsed_s': elapsed,
+        'sentences_per_second': stats.sentences / elapsed if elapsed > 0 else 0.0,
+        'mb_per_second': stats.bytes / 1e6 / elapsed if elapsed > 0 else 0.0,
+    }
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+    if not args.quiet:
+        print_summary(summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+`scheduler`
+================================================================================
+
+Deadline scheduler for the weather station main loop.
+
+Every peripheral (GPS, BME680, HM3301, each OLED) is registered as a periodic
+task with its own cadence and deadline. The loop sleeps until the earliest
+deadline instead of polling, and keeps per task run counts, missed deadlines
+and the CPU time each task used.
+
+Implementation Notes
+--------------------
+
+Tasks can be pulled forward with :meth:`Scheduler.trigger` (e.g. from a GPIO
+interrupt), which also wakes the sleeping loop.
+"""
+
+import heapq
+import threading
+import time
+
+# per-thread CPU clock, falls back to the process clock on python < 3.7
+_cpu_clock = getattr(time, "thread_time", time.process_time)
+
+
+class Task:
+    """A periodic job run by the :class:`Scheduler`.
+
+    :param str name: Name used in the statistics report.
+    :param callback: Callable run without arguments every `interval` seconds.
+    :param float interval: Cadence of the task in seconds.
+    :param float deadline: Time in seconds from release to completion after which a run
+      counts as missed. Defaults to `interval`."""
+
+    def __init__(self, name, callback, interval, deadline=None):
+        if interval <= 0:
+            raise ValueError("Task interval must be positive")
+
+        self.name = name
+        self.callback = callback
+        self.interval = interval
+        self.deadline = interval if deadline is None else deadline
+
+        self.next_run = 0.0
+        self.runs = 0
+        self.missed = 0
+        self.skipped = 0
+        self.errors = 0
+        self.cpu_time = 0.0
+        self.wall_time = 0.0
+        self.max_latency = 0.0
+
+    def stats(self):
+        """Returns a dictionary with the run statistics of the task"""
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "runs": self.runs,
+            "missed": self.missed,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "cpu_time": self.cpu_time,
+            "cpu_per_run": self.cpu_time / self.runs if self.runs else 0.0,
+            "wall_time": self.wall_time,
+            "max_latency": self.max_latency,
+        }
+
+
+class Scheduler:
+    """Runs :class:`Task` objects at their cadence, sleeping in between.
+
+    :param clock: Monotonic clock returning seconds. Defaults to :func:`time.monotonic`"""
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._tasks = {}
+        self._queue = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self.started = None
+
+    @property
+    def tasks(self):
+        """The registered tasks, in registration order"""
+        return list(self._tasks.values())
+
+    def add(self, name, callback, interval, deadline=None, delay=0.0):
+        """Register a new task, first run `delay` seconds from now. Returns the :class:`Task`."""
+        if name in self._tasks:
+            raise ValueError("Task '%s' already registered" % name)
+
+        task = Task(name, callback, interval, deadline)
+        self._tasks[name] = task
+        self._schedule(task, self._clock() + delay)
+        return task
+
+    def trigger(self, name):
+        """Run the task `name` as soon as possible and wake the loop. Safe to call from
+        other threads and interrupt callbacks. Does nothing if `name` is not registered
+        yet, e.g. for an interrupt firing during startup."""
+        task = self._tasks.get(name)
+        if task is None:
+            return
+        self._schedule(task, self._clock())
+        self._wake.set()
+
+    def _schedule(self, task, when):
+        with self._lock:
+            task.next_run = when
+            heapq.heappush(self._queue, (when, self._seq, task))
+            self._seq += 1
+
+    def _pop_due(self, now):
+        """Returns the next due task and its release time, or None"""
+        with self._lock:
+            while self._queue:
+                when, _, task = self._queue[0]
+                if when != task.next_run:
+                    # stale entry left behind by trigger()
+                    heapq.heappop(self._queue)
+                    continue
+                if when > now:
+                    return None
+                heapq.heappop(self._queue)
+                return task, when
+            return None
+
+    def time_to_next(self):
+        """Seconds until the earliest pending deadline, or None when there are no tasks"""
+        with self._lock:
+            while self._queue and self._queue[0][0] != self._queue[0][2].next_run:
+                heapq.heappop(self._queue)
+            if not self._queue:
+                return None
+            return max(0.0, self._queue[0][0] - self._clock())
+
+    def run_pending(self):
+        """Run every task whose release time has passed, earliest first. Returns the number
+        of tasks run."""
+        count = 0
+        now = self._clock()
+
+        while True:
+            due = self._pop_due(now)
+            if due is None:
+                break
+            task, release = due
+
+            start_cpu = _cpu_clock()
+            try:
+                task.callback()
+            except Exception as error:  # pylint: disable=broad-except
+                task.errors += 1
+                print("Task '%s' failed: %r" % (task.name, error))
+            task.cpu_time += _cpu_clock() - start_cpu
+
+            end = self._clock()
+            latency = end - release
+            task.runs += 1
+            task.wall_time += end - now
+            if latency > task.max_latency:
+                task.max_latency = latency
+            if latency > task.deadline:
+                task.missed += 1
+
+            # keep the task in phase, dropping the periods it overran
+            next_run = release + task.interval
+            if next_run <= end:
+                periods = int((end - next_run) // task.interval) + 1
+                task.skipped += periods
+                next_run += periods * task.interval
+            if task.next_run == release:
+                self._schedule(task, next_run)
+
+            count += 1
+            now = end
+
+        return count
+
+    def run(self):
+        """Run the tasks until :meth:`stop` is called, sleeping until the next deadline"""
+        self._running = True
+        self.started = self._clock()
+        while self._running:
+            self.run_pending()
+            delay = self.time_to_next()
+            if delay is None:
+                break
+            if delay > 0 and self._wake.wait(delay):
+                self._wake.clear()
+
+    def stop(self):
+        """Stop :meth:`run` after the current task"""
+        self._running = False
+        self._wake.set()
+
+    def stats(self):
+        """Returns a list with the statistics dictionary of every task"""
+        return [task.stats() for task in self._tasks.values()]
+
+    def report(self):
+        """Print a table with the run count, missed deadlines and CPU time of every task"""
+        elapsed = self._clock() - self.started if self.started is not None else 0.0
+        print_stats(self._tasks.values(), elapsed)
+
+
+def print_stats(tasks, elapsed):
+    """Print a table with the run count, missed deadlines and CPU time of `tasks`, with the
+    CPU load taken over `elapsed` seconds"""
+    print("%-10s %8s %7s %7s %10s %11s %6s" % (
+        "task", "runs", "missed", "skipped", "cpu [s]", "cpu/run[ms]", "cpu%"))
+    for task in tasks:
+        stats = task.stats()
+        load = 100 * stats["cpu_time"] / elapsed if elapsed > 0 else 0.0
+        print("%-10s %8d %7d %7d %10.3f %11.3f %6.1f" % (
+            stats["name"], stats["runs"], stats["missed"], stats["skipped"],
+            stats["cpu_time"], 1000 * stats["cpu_per_run"], load))
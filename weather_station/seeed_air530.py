@@ -28,7 +28,12 @@ Implementation Notes
   https://github.com/adafruit/circuitpython/releases
 
 """
+import calendar
+import itertools
+import threading
 import time
+from collections import OrderedDict
+from types import MappingProxyType
 from micropython import const
 
 __version__ = "0.0.0-auto.0"
@@ -46,17 +51,18 @@ _GSV19 = 8
 _ST_MIN = _GLL
 _ST_MAX = _GSV19
 
+# Field types, "_" marks a field that is not used and left unconverted
 _SENTENCE_PARAMS = (
     # 0 - _GLL
     "dcdcfcC",
     # 1 - _RMC
     "fcdcdcffiDCC",
     # 2 - _GGA
-    "fdcdciiffsfsIS",
+    "fdcdciiff_f___",
     # 3 - _GSA
     "ciIIIIIIIIIIIIfff",
     # 4 - _GSA_4_11
-    "ciIIIIIIIIIIIIfffS",
+    "ciIIIIIIIIIIIIfff_",
     # 5 - _GSV7
     "iiiiiiI",
     # 6 - _GSV11
@@ -68,9 +74,267 @@ _SENTENCE_PARAMS = (
 )
 
 
+# Known GNSS talkers
+# GA - Galileo
+# GB - BeiDou Systems
+# GI - NavIC
+# GL - GLONASS
+# GP - GPS
+# GQ - QZSS
+# GN - GNSS / More than one of the above
+_GNSS_TALKERS = (b"GA", b"GB", b"GI", b"GL", b"GP", b"GQ", b"GN")
+
+# Sentences each GPS attribute is read from
+_FIELD_SOURCES = {
+    # full date and time
+    "timestamp_utc": ("RMC", "ZDA"),
+    "utc_epoch": ("RMC", "ZDA"),
+    "datetime": ("RMC", "ZDA"),
+    "latitude": ("RMC", "GGA", "GLL"),
+    "longitude": ("RMC", "GGA", "GLL"),
+    "has_fix": ("GGA", "RMC"),
+    "fix_quality": ("GGA",),
+    "satellites": ("GGA", "GSV"),
+    "horizontal_dilution": ("GGA",),
+    "altitude_m": ("GGA",),
+    "height_geoid": ("GGA",),
+    "speed_knots": ("RMC",),
+    "track_angle_deg": ("RMC",),
+    "isactivedata": ("RMC", "GLL"),
+    "has_3d_fix": ("GSA",),
+    "fix_quality_3d": ("GSA",),
+    "sat_prns": ("GSA",),
+    "sel_mode": ("GSA",),
+    "pdop": ("GSA",),
+    "hdop": ("GSA",),
+    "vdop": ("GSA",),
+    "sats": ("GSV",),
+    "total_mess_num": ("GSV",),
+    "mess_num": ("GSV",),
+}
+
+# Typical bytes per fix of each sentence, GSV is 3 sentences with 12 satellites in view
+_SENTENCE_BYTES = {"GLL": 51, "RMC": 70, "GGA": 74, "GSA": 66, "GSV": 210, "ZDA": 38}
+
+# Position of each sentence in the PMTK314 output frequency fields
+_PMTK314_FIELDS = {"GLL": 0, "RMC": 1, "VTG": 2, "GGA": 3, "GSA": 4, "GSV": 5, "ZDA": 17}
+_PMTK314_LENGTH = 19
+
+# PMTK001 acknowledgement flags
+_PMTK_INVALID = 0
+_PMTK_UNSUPPORTED = 1
+_PMTK_FAILED = 2
+_PMTK_SUCCESS = 3
+
+# Sentences the module sends before it is configured
+_DEFAULT_SENTENCES = ("RMC", "GGA", "GSA", "GSV")
+
+# Baud rates PMTK251 can switch the UART to
+_BAUDRATES = (4800, 9600, 14400, 19200, 38400, 57600, 115200)
+
+# Fix interval limits of PMTK220, in milliseconds
+_MIN_FIX_INTERVAL = 100
+_MAX_FIX_INTERVAL = 10000
+
+
+def _minimal_sentences(fields):
+    """Returns the cheapest set of sentences, in bytes per fix, providing every one of `fields`"""
+    sources = []
+    for field in fields:
+        if field not in _FIELD_SOURCES:
+            raise ValueError("GPS: Unknown field '{}'".format(field))
+        sources.append(set(_FIELD_SOURCES[field]))
+
+    best = None
+    best_bytes = None
+    for size in range(len(_SENTENCE_BYTES) + 1):
+        for sentences in itertools.combinations(sorted(_SENTENCE_BYTES), size):
+            if not all(source.intersection(sentences) for source in sources):
+                continue
+            size_bytes = sum(_SENTENCE_BYTES[sentence] for sentence in sentences)
+            if best is None or size_bytes < best_bytes:
+                best, best_bytes = sentences, size_bytes
+    return best
+
+
+# Longest line kept while waiting for its end, NMEA allows 82 characters
+_MAX_SENTENCE = 128
+
+# Counter key of the lines without a well-formed address
+_OTHER_ADDRESS = b"?"
+
+# Seconds the background reader waits after a failed UART read
+_READER_BACKOFF = 0.1
+
+
+class _RingBuffer:
+    """Fixed size byte FIFO shared between the UART reader thread and the parser.
+    When it is full the oldest bytes are overwritten, so the newest data always wins."""
+
+    def __init__(self, size):
+        self._buffer = bytearray(size)
+        self._size = size
+        self._start = 0
+        self._count = 0
+        self._lock = threading.Lock()
+        self.bytes_written = 0
+        self.bytes_dropped = 0
+        self.overruns = 0
+
+    def __len__(self):
+        return self._count
+
+    def write(self, data):
+        """Append `data`, overwriting the oldest bytes if there is no room"""
+        length = len(data)
+        with self._lock:
+            self.bytes_written += length
+            if length >= self._size:
+                # only the tail of the data fits
+                self.bytes_dropped += self._count + length - self._size
+                self.overruns += 1
+                self._buffer[:] = data[-self._size:]
+                self._start = 0
+                self._count = self._size
+                return
+
+            overflow = self._count + length - self._size
+            if overflow > 0:
+                self.bytes_dropped += overflow
+                self.overruns += 1
+                self._start = (self._start + overflow) % self._size
+                self._count -= overflow
+
+            end = (self._start + self._count) % self._size
+            first = min(length, self._size - end)
+            self._buffer[end:end + first] = data[:first]
+            self._buffer[:length - first] = data[first:]
+            self._count += length
+
+    def read(self):
+        """Remove and return every buffered byte"""
+        with self._lock:
+            end = self._start + self._count
+            if end <= self._size:
+                data = bytes(self._buffer[self._start:end])
+            else:
+                data = bytes(self._buffer[self._start:]) + bytes(self._buffer[:end - self._size])
+            self._start = 0
+            self._count = 0
+            return data
+
+
+class _Satellite:
+    """One satellite in view, updated in place every time a GSV sentence reports it"""
+
+    __slots__ = ("talker", "prn", "elevation", "azimuth", "snr", "timestamp")
+
+    def __init__(self, talker, prn):
+        self.talker = talker
+        self.prn = prn
+        self.elevation = None
+        self.azimuth = None
+        self.snr = None
+        self.timestamp = None
+
+    @property
+    def name(self):
+        """The satellite number prefixed with its talker, e.g. 'GL71'"""
+        return "{}{}".format(self.talker, self.prn)
+
+    def as_tuple(self):
+        """Returns the (name, elevation, azimuth, snr, timestamp) tuple of GPS.sats"""
+        return (self.name, self.elevation, self.azimuth, self.snr, self.timestamp)
+
+
+class _SatelliteTable:
+    """Satellites in view of every constellation, keyed by talker and satellite number.
+
+    The records are kept in the order they were last seen, so expiring the stale
+    ones only visits the satellites that actually expire."""
+
+    def __init__(self, max_age=30):
+        self.max_age = max_age
+        # (talker, prn) -> _Satellite, least recently seen first
+        self._seen = OrderedDict()
+        # talker -> {prn: _Satellite}
+        self._constellations = {}
+        self._views = {}
+        # bumped on every change, see GPS.sats
+        self.version = 0
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __iter__(self):
+        return iter(self._seen.values())
+
+    def update(self, talker, prn, elevation, azimuth, snr, timestamp):
+        """Record a sighting of satellite `prn` of `talker`"""
+        key = (talker, prn)
+        sat = self._seen.get(key)
+        if sat is None:
+            sat = self._seen[key] = _Satellite(talker, prn)
+            constellation = self._constellations.get(talker)
+            if constellation is None:
+                constellation = self._constellations[talker] = {}
+                self._views[talker] = MappingProxyType(constellation)
+            constellation[prn] = sat
+        else:
+            self._seen.move_to_end(key)
+        sat.elevation = elevation
+        sat.azimuth = azimuth
+        sat.snr = snr
+        sat.timestamp = timestamp
+        self.version += 1
+
+    def expire(self, now):
+        """Drop the satellites not seen for more than `max_age` seconds. Returns how many"""
+        seen = self._seen
+        expired = 0
+        while seen:
+            key, sat = next(iter(seen.items()))
+            if now - sat.timestamp <= self.max_age:
+                break
+            del seen[key]
+            del self._constellations[sat.talker][sat.prn]
+            expired += 1
+        if expired:
+            self.version += 1
+        return expired
+
+    def constellation(self, talker):
+        """Returns a read-only {prn: satellite} view of the satellites of `talker`, e.g. 'GL'"""
+        view = self._views.get(talker)
+        if view is None:
+            return MappingProxyType({})
+        return view
+
+    def talkers(self):
+        """Returns the talkers that have satellites in the table"""
+        return [talker for talker, sats in self._constellations.items() if sats]
+
+
+# Low byte masks used by _checksum()
+_MASKS = tuple((1 << (8 * size)) - 1 for size in range(_MAX_SENTENCE))
+
+
+def _checksum(data):
+    """XOR of every byte of `data`, folding the bytes as one integer instead of
+    looping over them"""
+    value = int.from_bytes(data, "little")
+    size = len(data)
+    while size > 1:
+        half = (size + 1) // 2
+        value = (value >> (8 * half)) ^ (value & _MASKS[half])
+        size = half
+    return value
+
+
 # Internal helper parsing functions.
 # These handle input that might be none or null and return none instead of
-# throwing errors.
+# throwing errors. The fields are the raw bytes of the sentence, int() and
+# float() parse them without decoding.
 def _parse_degrees(nmea_data):
     # Parse a NMEA lat/long data pair 'dddmm.mmmm' into a pure degrees value.
     # Where ddd is the degrees, mm.mmmm is the minutes.
@@ -83,21 +347,21 @@ def _parse_degrees(nmea_data):
 
 
 def _parse_int(nmea_data):
-    if nmea_data is None or nmea_data == "":
+    if not nmea_data:
         return None
     return int(nmea_data)
 
 
 def _parse_float(nmea_data):
-    if nmea_data is None or nmea_data == "":
+    if not nmea_data:
         return None
     return float(nmea_data)
 
 
 def _parse_str(nmea_data):
-    if nmea_data is None or nmea_data == "":
+    if not nmea_data:
         return None
-    return str(nmea_data)
+    return nmea_data.decode("ascii")
 
 
 def _read_degrees(data, index, neg):
@@ -107,88 +371,112 @@ def _read_degrees(data, index, neg):
     return x
 
 
+def _sentence_filter(sentences):
+    # Expand the allowed sentence types, "GGA" stands for the GGA sentence of
+    # every GNSS talker, a full address such as "GNRMC" or "PMTK001" only for itself
+    if sentences is None:
+        return None
+    # command acknowledgements are always needed
+    allowed = {b"PMTK001"}
+    for sentence in sentences:
+        if isinstance(sentence, str):
+            sentence = sentence.encode("ascii")
+        sentence = sentence.upper()
+        if len(sentence) == 3:
+            allowed.update(talker + sentence for talker in _GNSS_TALKERS)
+        else:
+            allowed.add(sentence)
+    return frozenset(allowed)
+
+
+def _sentence_address(line):
+    # The address field of a raw line, e.g. b"GPGGA" for b"$GPGGA,...", without decoding it
+    comma = line.find(b",", 1, 12)
+    if comma == -1:
+        return b""
+    return line[1:comma]
+
+
+def _counted_address(line, address):
+    # The address a line is counted under, noise and lines received at the wrong
+    # baud rate all go to b"?" so that the counters stay bounded
+    if line[:1] == b"$" and len(address) >= 5 and address.isalnum() and address.isupper():
+        return address
+    return _OTHER_ADDRESS
+
+
 def _parse_talker(data_type):
     # Split the data_type into talker and sentence_type
-    if data_type[0] == b"P":  # Proprietary codes
+    if data_type[:1] == b"P":  # Proprietary codes
         return (data_type[:1], data_type[1:])
 
     return (data_type[:2], data_type[2:])
 
 
+def _parse_char(nmea_data):
+    # A single character
+    if len(nmea_data) != 1:
+        raise ValueError("GPS: Expected a single character")
+    return chr(nmea_data[0])
+
+
+# Expression converting the field {0} for each parameter type of _SENTENCE_PARAMS
+_CONVERTERS = {
+    # Not used, skip the conversion
+    "_": "None",
+    # A single character
+    "c": "_parse_char({0})",
+    # A single character or Nothing
+    "C": "_parse_char({0}) if {0} else None",
+    # A number parseable as degrees, or Nothing
+    "d": "_parse_degrees({0})",
+    "D": "_parse_degrees({0})",
+    # A floating point number
+    "f": "float({0}) if {0} else None",
+    # An integer, or Nothing
+    "i": "int({0}) if {0} else None",
+    "I": "int({0}) if {0} else None",
+    # A string, or Nothing
+    "s": "{0}.decode('ascii')",
+    "S": "{0}.decode('ascii') if {0} else None",
+}
+
+
+def _compile_params(param_types):
+    """Generate a function converting the fields of a sentence with the layout
+    `param_types` in a single expression, without any per-field type dispatch"""
+    fields = ["f%d" % i for i in range(len(param_types))]
+    try:
+        values = [_CONVERTERS[pti].format(field) for pti, field in zip(param_types, fields)]
+    except KeyError as error:
+        raise TypeError(f"GPS: Unexpected parameter type {error}") from None
+
+    source = "def decode(data):\n    %s, = data\n    return [%s]\n" % (
+        ", ".join(fields), ", ".join(values))
+    namespace = {"_parse_char": _parse_char, "_parse_degrees": _parse_degrees}
+    exec(source, namespace)  # pylint: disable=exec-used
+    return namespace["decode"]
+
+
+# Decoders of the sentence types, compiled once at import
+_DECODERS = tuple(_compile_params(param_types) for param_types in _SENTENCE_PARAMS)
+
+
 def _parse_data(sentence_type, data):
     """Parse sentence data for the specified sentence type and
     return a list of parameters in the correct format, or return None.
     """
-    # pylint: disable=too-many-branches
-
     if not _ST_MIN <= sentence_type <= _ST_MAX:
         # The sentence_type is unknown
         return None
 
-    param_types = _SENTENCE_PARAMS[sentence_type]
-
-    if len(param_types) != len(data):
-        # The expected number does not match the number of data items
-        return None
-
-    params = []
     try:
-        for i, dti in enumerate(data):
-            pti = param_types[i]
-            len_dti = len(dti)
-            nothing = dti is None or len_dti == 0
-            if pti == "c":
-                # A single character
-                if len_dti != 1:
-                    return None
-                params.append(dti)
-            elif pti == "C":
-                # A single character or Nothing
-                if nothing:
-                    params.append(None)
-                elif len_dti != 1:
-                    return None
-                else:
-                    params.append(dti)
-            elif pti == "d":
-                # A number parseable as degrees
-                params.append(_parse_degrees(dti))
-            elif pti == "D":
-                # A number parseable as degrees or Nothing
-                if nothing:
-                    params.append(None)
-                else:
-                    params.append(_parse_degrees(dti))
-            elif pti == "f":
-                # A floating point number
-                params.append(_parse_float(dti))
-            elif pti == "i":
-                # An integer
-                params.append(_parse_int(dti))
-            elif pti == "I":
-                # An integer or Nothing
-                if nothing:
-                    params.append(None)
-                else:
-                    params.append(_parse_int(dti))
-            elif pti == "s":
-                # A string
-                params.append(dti)
-            elif pti == "S":
-                # A string or Nothing
-                if nothing:
-                    params.append(None)
-                else:
-                    params.append(dti)
-            else:
-                raise TypeError(f"GPS: Unexpected parameter type '{pti}'")
-    except ValueError:
+        # unpacking the wrong number of data items raises a ValueError too
+        return _DECODERS[sentence_type](data)
+    except (ValueError, UnicodeError):
         # Something didn't parse, abort
         return None
 
-    # Return the parsed data
-    return params
-
 
 # lint warning about too many attributes disabled
 # pylint: disable-msg=R0902
@@ -197,12 +485,29 @@ def _parse_data(sentence_type, data):
 class GPS:
     """GPS parsing module.  Can parse simple NMEA data sentences from serial
     GPS modules to read latitude, longitude, and more.
+
+    :param uart: The serial port the GPS module is connected to.
+    :param bool debug: Print every parsed sentence.
+    :param bool bulk_read: Make update() process everything the UART holds without blocking.
+    :param sentences: Sentence types to parse, such as ``("GGA", "RMC")`` for every talker
+      or ``("GNGGA",)`` for a single one. Other lines are dropped before any checksum or
+      decoding work. None parses every sentence.
     """
 
-    def __init__(self, uart, debug=False):
+    def __init__(self, uart, debug=False, *, bulk_read=False, sentences=None):
         self._uart = uart
         # Initialize null starting values for GPS attributes.
-        self.timestamp_utc = None
+        # UTC date and time of the last fix, see timestamp_utc and utc_now()
+        self._date = None
+        self._ymd = (0, 0, 0)
+        self._day_epoch = None
+        self._time_utc = None
+        self._timestamp_utc = None
+        self.utc_epoch = None
+        self.utc_anchor = None
+        # time of day of the last fix with its fraction, see fix_anchor
+        self._fix_time = None
+        self.fix_anchor = None
         self.latitude = None
         self.longitude = None
         self.fix_quality = 0
@@ -215,7 +520,11 @@ class GPS:
         self.speed_knots = None
         self.track_angle_deg = None
         self._sats = None  # Temporary holder for information from GSV messages
-        self.sats = None  # Completed information from GSV messages
+        # Completed information from GSV messages, see sats and constellation()
+        self.satellite_table = _SatelliteTable()
+        self._sats_dict = None
+        self._sats_version = -1
+        self.gsv_cycles = 0
         self.isactivedata = None
         self.true_track = None
         self.mag_track = None
@@ -230,12 +539,111 @@ class GPS:
         self._mode_indicator = None
         self._magnetic_variation = None
         self.debug = debug
+        # Background UART reader, see start_reader()
+        self._reader = None
+        self._reading = False
+        self._ring = None
+        # UART errors of the background reader, the last one is raised by update()
+        self.reader_errors = 0
+        self._reader_error = None
+        self._partial = b""
+        self.sentences_parsed = 0
+        # Read everything the UART has in update() instead of a line at a time
+        self.bulk_read = bulk_read
+        # Sentence types to parse, the others are dropped before the checksum.
+        # Lines seen per address (b"GPGGA"...), accepted or skipped.
+        self._allowed = _sentence_filter(sentences)
+        self._accepted = {}
+        self._skipped = {}
+        # PMTK001 flag received for each command, see configure()
+        self._acks = {}
+        self.output_sentences = None
+        self.fix_interval = None
+
+    def start_reader(self, buffer_size=4096):
+        """Start a background thread that drains the UART into a ring buffer of
+        `buffer_size` bytes. update() then parses every complete sentence received
+        since the last call instead of one sentence per call."""
+        if self._reader is not None:
+            return
+        self._ring = _RingBuffer(buffer_size)
+        self._partial = b""
+        self._reading = True
+        self._reader = threading.Thread(target=self._read_uart, name="air530-uart", daemon=True)
+        self._reader.start()
+
+    def stop_reader(self, timeout=None):
+        """Stop the background UART reader started by start_reader()"""
+        if self._reader is None:
+            return
+        self._reading = False
+        # unblock a pending read on pyserial ports
+        cancel_read = getattr(self._uart, "cancel_read", None)
+        if cancel_read is not None:
+            cancel_read()
+        self._reader.join(timeout)
+        self._reader = None
+
+    def _read_uart(self):
+        failing = False
+        while self._reading:
+            try:
+                # block for the first byte, then take whatever else already arrived
+                data = self._uart.read(max(1, self._uart.in_waiting))
+            except OSError as error:
+                # pyserial's SerialException included: a USB UART dropping out or the
+                # port being reopened. Keep reading, update() reports the error.
+                self.reader_errors += 1
+                self._reader_error = error
+                if not failing:
+                    print("GPS: UART read failed: {!r}".format(error))
+                    failing = True
+                time.sleep(_READER_BACKOFF)
+                continue
+            failing = False
+            if data:
+                self._ring.write(data)
+
+    @property
+    def bytes_received(self):
+        """Number of bytes the background reader took from the UART"""
+        return self._ring.bytes_written if self._ring is not None else 0
+
+    @property
+    def bytes_dropped(self):
+        """Number of received bytes overwritten before they could be parsed"""
+        return self._ring.bytes_dropped if self._ring is not None else 0
+
+    @property
+    def overruns(self):
+        """Number of times the ring buffer was full and had to drop data"""
+        return self._ring.overruns if self._ring is not None else 0
 
     def update(self):
         """Check for updated data from the GPS module and process it
         accordingly.  Returns True if new data was processed, and False if
         nothing new was received.
+
+        With the background reader or `bulk_read`, every complete sentence
+        received since the last call is processed and the number of sentences
+        handled is returned instead. These modes never block. A UART error of
+        the background reader since the last call is raised once the sentences
+        received before it are processed.
         """
+        if self._reader is not None:
+            handled = self.feed(self._ring.read())
+            error = self._reader_error
+            if error is not None:
+                self._reader_error = None
+                raise error
+            return handled
+
+        if self.bulk_read:
+            waiting = self._uart.in_waiting
+            if not waiting:
+                return 0
+            return self.feed(self._uart.read(waiting))
+
         # Grab a sentence and check its data type to call the appropriate
         # parsing function.
 
@@ -243,31 +651,85 @@ class GPS:
             sentence = self._parse_sentence()
         except UnicodeError:
             return None
+        return self._process_sentence(sentence)
+
+    def _accept(self, line):
+        # Check the address of a raw line against the allowed sentence types
+        address = _sentence_address(line)
+        counted = _counted_address(line, address)
+        if self._allowed is not None and address not in self._allowed:
+            self._skipped[counted] = self._skipped.get(counted, 0) + 1
+            return False
+        self._accepted[counted] = self._accepted.get(counted, 0) + 1
+        return True
+
+    @property
+    def sentences_accepted(self):
+        """Number of lines of each sentence type that were parsed, e.g. {'GPGGA': 10}.
+        Lines without a well-formed address are counted under '?'."""
+        return {address.decode("ascii", "replace"): count for address, count in self._accepted.items()}
+
+    @property
+    def lines_received(self):
+        """Number of lines fed to the parser, parsed or dropped by the `sentences` allow-list"""
+        return sum(self._accepted.values()) + sum(self._skipped.values())
+
+    @property
+    def sentences_skipped(self):
+        """Number of lines of each sentence type dropped by the `sentences` allow-list"""
+        return {address.decode("ascii", "replace"): count for address, count in self._skipped.items()}
+
+    def feed(self, data):
+        """Process the sentences in `data`, a chunk of the raw UART stream. A
+        line left incomplete at the end is kept until the rest of it is fed.
+        Returns the number of sentences handled."""
+        if not data:
+            return 0
+
+        # frame on CR and LF alike, the empty lines between them are skipped
+        lines = (self._partial + data).replace(b"\r", b"\n").split(b"\n")
+        self._partial = lines.pop()
+        if len(self._partial) > _MAX_SENTENCE:
+            self._partial = b""
+
+        handled = 0
+        for line in lines:
+            if not line or not self._accept(line):
+                continue
+            try:
+                sentence = self._check_sentence(line)
+            except (UnicodeError, ValueError):
+                continue
+            if sentence is None:
+                continue
+            if self._process_sentence(self._split_sentence(sentence)):
+                handled += 1
+
+        return handled
+
+    def _process_sentence(self, sentence):
+        # Check the sentence data type to call the appropriate parsing function.
         if sentence is None:
             return False
+        self.sentences_parsed += 1
         if self.debug:
             print(sentence)
         data_type, args = sentence
         if len(data_type) < 5:
             return False
-        data_type = bytes(data_type.upper(), "ascii")
+        data_type = data_type.upper()
+        if data_type == b"PMTK001":  # Command acknowledgement
+            return self._parse_pmtk001(args.split(b","))
         (talker, sentence_type) = _parse_talker(data_type)
 
         # Check for all currently known GNSS talkers
-        # GA - Galileo
-        # GB - BeiDou Systems
-        # GI - NavIC
-        # GL - GLONASS
-        # GP - GPS
-        # GQ - QZSS
-        # GN - GNSS / More than one of the above
-        if talker not in (b"GA", b"GB", b"GI", b"GL", b"GP", b"GQ", b"GN"):
+        if talker not in _GNSS_TALKERS:
             # It's not a known GNSS source of data
             # Assume it's a valid packet anyway
             return True
 
         result = True
-        args = args.split(",")
+        args = args.split(b",")
         if sentence_type == b"GLL":  # Geographic position - Latitude/Longitude
             result = self._parse_gll(args)
         elif sentence_type == b"RMC":  # Minimum location info
@@ -300,6 +762,166 @@ class GPS:
             self.write(bytes("{:02x}".format(checksum).upper(), "ascii"))
         self.write(b"\r\n")
 
+    def configure(self, fields, rate=1.0, timeout=1.0, retries=2):
+        """Limit the output of the module to what the application reads.
+
+        Derives the smallest set of sentences providing every attribute named in
+        `fields` (e.g. ``("latitude", "longitude", "timestamp_utc")``), enables only
+        those with PMTK314 and sets the fix rate with PMTK220, lowered if the sentences
+        would not fit through the UART at `rate` Hz. Both commands are sent up to
+        `retries` + 1 times, waiting `timeout` seconds for their PMTK001 acknowledgement.
+        The parser is limited to the same sentences once the module acknowledged both
+        commands, and keeps its previous sentences otherwise.
+
+        Returns True if the module acknowledged both commands."""
+        sentences = _minimal_sentences(fields)
+        rate = min(rate, self.max_fix_rate(sentences))
+
+        frequencies = [0] * _PMTK314_LENGTH
+        for sentence in sentences:
+            frequencies[_PMTK314_FIELDS[sentence]] = 1
+        output = b"PMTK314," + b",".join(b"%d" % frequency for frequency in frequencies)
+
+        # the parser keeps every sentence until the module confirms it sends fewer
+        if not self.send_verified(output, timeout, retries):
+            return False
+
+        previous = self._allowed, self.output_sentences
+        self._allowed = _sentence_filter(sentences)
+        self.output_sentences = sentences
+        if self.set_fix_rate(rate, timeout, retries):
+            return True
+        self._allowed, self.output_sentences = previous
+        return False
+
+    def max_fix_rate(self, sentences=None):
+        """Highest fix rate in Hz at which `sentences` fit through the UART at its
+        current baud rate, by default the configured output sentences"""
+        if sentences is None:
+            sentences = self.output_sentences or _DEFAULT_SENTENCES
+        fix_bytes = sum(_SENTENCE_BYTES[sentence] for sentence in sentences)
+        # keep a margin of 10% of the UART bandwidth
+        bytes_per_second = 0.9 * getattr(self._uart, "baudrate", 9600) / 10
+        if not fix_bytes:
+            return 1000 / _MIN_FIX_INTERVAL
+        return bytes_per_second / fix_bytes
+
+    def set_fix_rate(self, rate, timeout=1.0, retries=2):
+        """Set the fix rate to `rate` Hz with PMTK220, 10 Hz at most. Raises ValueError
+        if the output sentences do not fit through the UART at that rate, see
+        negotiate_baudrate(). Returns True if the module acknowledged the command."""
+        if rate > self.max_fix_rate() * 1.001:
+            raise ValueError(
+                "GPS: {} Hz needs more than {} baud".format(rate, self._uart.baudrate))
+        interval = int(round(1000 / rate)) if rate > 0 else _MAX_FIX_INTERVAL
+        interval = max(_MIN_FIX_INTERVAL, min(_MAX_FIX_INTERVAL, interval))
+
+        if not self.send_verified(b"PMTK220,%d" % interval, timeout, retries):
+            return False
+        self.fix_interval = interval
+        return True
+
+    def set_baudrate(self, baudrate, timeout=3.0):
+        """Switch the module to `baudrate` with PMTK251 and the serial port with it.
+
+        The switch only counts once `timeout` seconds bring valid sentences at the
+        new rate; otherwise the module and the port are put back to the previous
+        rate. The background reader must not be running. Returns True on success."""
+        if self._reader is not None:
+            raise RuntimeError("GPS: Stop the reader before changing the baud rate")
+        if baudrate not in _BAUDRATES:
+            raise ValueError("GPS: Unsupported baud rate {}".format(baudrate))
+
+        previous = self._uart.baudrate
+        if baudrate == previous:
+            return True
+
+        self._switch_baudrate(baudrate)
+        if self._wait_sentences(timeout):
+            return True
+
+        # the module did not follow or the link is not clean at the new rate,
+        # tell the module to go back in case it did switch
+        self._switch_baudrate(previous)
+        self._wait_sentences(timeout)
+        return False
+
+    def negotiate_baudrate(self, baudrates=(115200, 57600, 38400, 19200), timeout=3.0):
+        """Switch to the first of `baudrates` the link works at, keeping the current
+        baud rate if none does. Returns the baud rate in use."""
+        for baudrate in baudrates:
+            if self.set_baudrate(baudrate, timeout):
+                break
+        return self._uart.baudrate
+
+    def _switch_baudrate(self, baudrate):
+        # Send PMTK251 at the current rate, then reconfigure the port. pyserial and
+        # busio.UART apply a new baudrate to the open port straight away.
+        self.send_command(b"PMTK251,%d" % baudrate)
+        flush = getattr(self._uart, "flush", None)
+        if flush is not None:
+            flush()
+        # let the module finish switching before listening at the new rate
+        time.sleep(0.05)
+        self._uart.baudrate = baudrate
+        reset_input_buffer = getattr(self._uart, "reset_input_buffer", None)
+        if reset_input_buffer is not None:
+            reset_input_buffer()
+        self._partial = b""
+
+    def _wait_sentences(self, timeout, count=2):
+        # Wait until `count` valid sentences arrived, returns False on timeout
+        handled = 0
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            handled += self._poll()
+            if handled >= count:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def send_verified(self, command, timeout=1.0, retries=2):
+        """Send a PMTK command and wait up to `timeout` seconds for its PMTK001
+        acknowledgement, sending it again up to `retries` times if none arrives.
+        Returns True if the module reported success."""
+        command_id = command[4:7]
+        for _ in range(retries + 1):
+            self._acks.pop(command_id, None)
+            self.send_command(command)
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                self._poll()
+                flag = self._acks.get(command_id)
+                if flag == _PMTK_SUCCESS:
+                    return True
+                if flag in (_PMTK_INVALID, _PMTK_UNSUPPORTED):
+                    # sending it again will not help
+                    return False
+                if flag == _PMTK_FAILED:
+                    break
+                time.sleep(0.01)
+        return False
+
+    def _poll(self):
+        # Process what arrived without blocking, whatever the read mode
+        # and return the number of sentences handled
+        if self._reader is not None or self.bulk_read:
+            return self.update()
+        waiting = self._uart.in_waiting
+        if not waiting:
+            return 0
+        return self.feed(self._uart.read(waiting))
+
+    def _parse_pmtk001(self, data):
+        # PMTK001 - Acknowledgement: command, flag
+        if len(data) < 2:
+            return False
+        try:
+            self._acks[data[0]] = int(data[1])
+        except ValueError:
+            return False
+        return True
+
     @property
     def has_fix(self):
         """True if a current fix for location information is available."""
@@ -312,15 +934,63 @@ class GPS:
         passing it the same data"""
         return self.fix_quality_3d is not None and self.fix_quality_3d >= 2
 
+    @property
+    def timestamp_utc(self):
+        """UTC date and time of the last fix as a struct_time, None before the first one.
+        The date is 0-0-0 until a sentence with a date arrives."""
+        if self._timestamp_utc is None and self._time_utc is not None:
+            time_utc = self._time_utc
+            year, month, day = self._ymd
+            self._timestamp_utc = time.struct_time(
+                (year, month, day, time_utc // 10000, (time_utc // 100) % 100, time_utc % 100, 0, 0, -1)
+            )
+        return self._timestamp_utc
+
+    def utc_now(self, monotonic=None):
+        """Returns the UTC time in seconds since the epoch at :func:`time.monotonic` time
+        `monotonic`, now by default, extrapolated from the last fix. None without a dated fix.
+
+        `utc_epoch` is the UTC second of the last fix and `utc_anchor` the monotonic time
+        the first sentence of that second was parsed, so readings taken on this clock are
+        stamped with UTC by a single addition. `fix_anchor` is the monotonic time the first
+        sentence of the last fix was parsed, it changes with every fix at rates above 1 Hz."""
+        if self.utc_epoch is None:
+            return None
+        if monotonic is None:
+            monotonic = time.monotonic()
+        return self.utc_epoch + (monotonic - self.utc_anchor)
+
     @property
     def datetime(self):
         """Return struct_time object to feed rtc.set_time_source() function"""
         return self.timestamp_utc
 
+    @property
+    def sats(self):
+        """Satellites in view as {'GP4': (name, elevation, azimuth, snr, timestamp)},
+        None until a complete GSV cycle was received. Rebuilt only when the table changed,
+        constellation() reads the table without building it."""
+        if not self.gsv_cycles:
+            return None
+        table = self.satellite_table
+        if self._sats_version != table.version:
+            self._sats_version = table.version
+            self._sats_dict = {sat.name: sat.as_tuple() for sat in table}
+        return self._sats_dict
+
+    def constellation(self, talker):
+        """Returns a read-only {prn: satellite} view of the satellites in view of
+        `talker`, e.g. 'GP', 'GL' or 'GB'. Each satellite has talker, prn, elevation,
+        azimuth, snr and timestamp attributes."""
+        return self.satellite_table.constellation(talker)
+
     @property
     def nmea_sentence(self):
         """Return raw_sentence which is the raw NMEA sentence read from the GPS"""
-        return self._raw_sentence
+        if self._raw_sentence is None:
+            return None
+        # only decoded when asked for, the parser works on the raw bytes
+        return self._raw_sentence.decode("ascii", "replace")
 
     def read(self, num_bytes):
         """Read up to num_bytes of data from the GPS directly, without parsing.
@@ -351,21 +1021,21 @@ class GPS:
         if self.in_waiting < 11:
             return None
 
-        sentence = self.readline()
-        if sentence is None or sentence == b"" or len(sentence) < 1:
+        line = self.readline()
+        if not line or not self._accept(line.lstrip()):
             return None
-        try:
-            sentence = str(sentence, "ascii").strip()
-        except UnicodeError:
+        return self._check_sentence(line)
+
+    def _check_sentence(self, sentence):
+        # Return the stripped raw line if its checksum is valid
+        if not sentence:
             return None
+        sentence = bytes(sentence).strip()
         # Look for a checksum and validate it if present.
-        if len(sentence) > 7 and sentence[-3] == "*":
+        if 7 < len(sentence) <= _MAX_SENTENCE and sentence[-3] == 0x2A:  # '*'
             # Get included checksum, then calculate it and compare.
             expected = int(sentence[-2:], 16)
-            actual = 0
-            for i in range(1, len(sentence) - 3):
-                actual ^= ord(sentence[i])
-            if actual != expected:
+            if _checksum(sentence[1:-3]) != expected:
                 return None  # Failed to validate checksum.
 
             # copy the raw sentence
@@ -382,35 +1052,49 @@ class GPS:
         if sentence is None:
             return None
 
+        return self._split_sentence(sentence)
+
+    def _split_sentence(self, sentence):
         # Remove checksum once validated.
         sentence = sentence[:-3]
         # Parse out the type of sentence (first string after $ up to comma)
         # and then grab the rest as data within the sentence.
-        delimiter = sentence.find(",")
+        delimiter = sentence.find(b",")
         if delimiter == -1:
             return None  # Invalid sentence, no comma after data type.
         data_type = sentence[1:delimiter]
         return (data_type, sentence[delimiter + 1 :])
 
-    def _update_timestamp_utc(self, time_utc, date=None):
-        hours = time_utc // 10000
-        mins = (time_utc // 100) % 100
-        secs = time_utc % 100
-        if date is None:
-            if self.timestamp_utc is None:
-                day, month, year = 0, 0, 0
-            else:
-                day = self.timestamp_utc.tm_mday
-                month = self.timestamp_utc.tm_mon
-                year = self.timestamp_utc.tm_year
-        else:
+    def _update_timestamp_utc(self, fix_time, date=None):
+        # GGA, RMC and ZDA of the same fix repeat its time, only the first one counts.
+        # fix_anchor moves with every fix, utc_epoch and utc_anchor with every second
+        if fix_time != self._fix_time:
+            self._fix_time = fix_time
+            self.fix_anchor = time.monotonic()
+
+        time_utc = int(fix_time)
+        if time_utc == self._time_utc and (date is None or date == self._date):
+            return
+
+        if date is not None and date != self._date:
+            self._date = date
             day = date // 10000
             month = (date // 100) % 100
             year = 2000 + date % 100
+            self._ymd = (year, month, day)
+            if 1 <= month <= 12 and 1 <= day <= 31:
+                self._day_epoch = calendar.timegm((year, month, day, 0, 0, 0))
+            else:
+                self._day_epoch = None
 
-        self.timestamp_utc = time.struct_time(
-            (year, month, day, hours, mins, secs, 0, 0, -1)
-        )
+        self._time_utc = time_utc
+        self._timestamp_utc = None
+        self.utc_anchor = time.monotonic()
+        if self._day_epoch is None:
+            self.utc_epoch = None
+        else:
+            self.utc_epoch = (self._day_epoch + 3600 * (time_utc // 10000)
+                              + 60 * ((time_utc // 100) % 100) + time_utc % 100)
 
     def _parse_gll(self, data):
         # GLL - Geographic Position - Latitude/Longitude
@@ -428,7 +1112,7 @@ class GPS:
         self.longitude = _read_degrees(data, 2, "w")
 
         # UTC time of position
-        self._update_timestamp_utc(int(data[4]))
+        self._update_timestamp_utc(data[4])
 
         # Status Valid(A) or Invalid(V)
         self.isactivedata = data[5]
@@ -448,7 +1132,7 @@ class GPS:
             return False  # Params didn't parse
 
         # UTC time of position and date
-        self._update_timestamp_utc(int(data[0]), data[8])
+        self._update_timestamp_utc(data[0], data[8])
 
         # Status Valid(A) or Invalid(V)
         self.isactivedata = data[1]
@@ -490,7 +1174,7 @@ class GPS:
         # UTC time of position
         try:
             date = int(data[3])%100 + int(data[2])*100 + int(data[1])*10000
-            self._update_timestamp_utc(int(float(data[0])), date=date)
+            self._update_timestamp_utc(float(data[0]), date=date)
         except:
             return False
 
@@ -506,7 +1190,7 @@ class GPS:
             return False  # Params didn't parse
 
         # UTC time of position
-        self._update_timestamp_utc(int(data[0]))
+        self._update_timestamp_utc(data[0])
 
         # Latitude
         self.latitude = _read_degrees(data, 1, "s")
@@ -533,11 +1217,11 @@ class GPS:
         self.horizontal_dilution = data[7]
 
         # Antenna altitude relative to mean sea level
-        self.altitude_m = _parse_float(data[8])
+        self.altitude_m = data[8]
         # data[9] - antenna altitude unit, always 'M' ???
 
         # Geoidal separation relative to WGS 84
-        self.height_geoid = _parse_float(data[10])
+        self.height_geoid = data[10]
         # data[11] - geoidal separation unit, always 'M' ???
 
         # data[12] - Age of differential GPS data, can be null
@@ -571,13 +1255,13 @@ class GPS:
             self.sat_prns.append("{}{}".format(talker, sat))
 
         # PDOP, dilution of precision
-        self.pdop = _parse_float(data[14])
+        self.pdop = data[14]
 
         # HDOP, horizontal dilution of precision
-        self.hdop = _parse_float(data[15])
+        self.hdop = data[15]
 
         # VDOP, vertical dilution of precision
-        self.vdop = _parse_float(data[16])
+        self.vdop = data[16]
 
         # data[17] - System ID
 
@@ -607,48 +1291,23 @@ class GPS:
 
         sat_tup = data[3:]
 
-        satlist = []
-        timestamp = time.monotonic()
-        for i in range(len(sat_tup) // 4):
-            j = i * 4
-            value = (
-                # Satellite number
-                "{}{}".format(talker, sat_tup[0 + j]),
-                # Elevation in degrees
-                sat_tup[1 + j],
-                # Azimuth in degrees
-                sat_tup[2 + j],
-                # signal-to-noise ratio in dB
-                sat_tup[3 + j],
-                # Timestamp
-                timestamp,
-            )
-            satlist.append(value)
-
         if self._sats is None:
             self._sats = []
-        for value in satlist:
-            self._sats.append(value)
+        for j in range(0, len(sat_tup) - 3, 4):
+            # satellite number, elevation and azimuth in degrees, signal-to-noise ratio in dB
+            self._sats.append((talker, sat_tup[j], sat_tup[j + 1], sat_tup[j + 2], sat_tup[j + 3]))
 
         if self.mess_num == self.total_mess_num:
             # Last part of GSV message
             if len(self._sats) == self.satellites:
-                # Transfer received satellites to self.sats
-                if self.sats is None:
-                    self.sats = {}
-                else:
-                    # Remove all satellites which haven't
-                    # been seen for 30 seconds
-                    timestamp = time.monotonic()
-                    old = []
-                    for i in self.sats:
-                        sat = self.sats[i]
-                        if (timestamp - sat[4]) > 30:
-                            old.append(i)
-                    for i in old:
-                        self.sats.pop(i)
-                for sat in self._sats:
-                    self.sats[sat[0]] = sat
+                # Transfer received satellites to the table and remove all
+                # satellites which haven't been seen for 30 seconds
+                table = self.satellite_table
+                timestamp = time.monotonic()
+                table.expire(timestamp)
+                for talker, prn, elevation, azimuth, snr in self._sats:
+                    table.update(talker, prn, elevation, azimuth, snr, timestamp)
+                self.gsv_cycles += 1
             self._sats.clear()
 
         self.satellites_prev = self.satellites
@@ -37,115 +37,211 @@ __version__ = "1.0.00"
 #    -----------------------------------------------------------------------
 _HM3301_ADDRESS = const(0x40)
 
-_HM3301_CHIPID = bytearray.fromhex("001C")
+_HM3301_SENSOR_NUMBER = const(0x001C)
 _HM3301_DATA_SIZE = 29
 
-def _read16(arr):
-    """Parse an unsigned 16-bit value as an integer."""
-   
-    return arr[0] << 8 | arr[1]
+# the fields of a frame, every one big endian 16-bit but the 8-bit checksum
+_HM3301_FIELDS = (
+    "status",
+    "sensor_number",
+    "pm1_0_std",
+    "pm2_5_std",
+    "pm10_std",
+    "pm1_0_atm",
+    "pm2_5_atm",
+    "pm10_atm",
+    "count_0_3",
+    "count_0_5",
+    "count_1_0",
+    "count_2_5",
+    "count_5_0",
+    "count_10",
+    "checksum",
+)
+_HM3301_FRAME = struct.Struct(">14HB")
+
+
+class HM3301Reading:
+    """Every field of one HM3301 frame, immutable.
+
+    * ``status``: reserved word, used as a status word by some firmware
+    * ``sensor_number``: sensor number, 0x001C for the HM3301
+    * ``pm1_0_std``, ``pm2_5_std``, ``pm10_std``: standard (CF=1) PM1.0, PM2.5 and PM10
+      concentrations in ug/m3
+    * ``pm1_0_atm``, ``pm2_5_atm``, ``pm10_atm``: atmospheric environment PM1.0, PM2.5 and
+      PM10 concentrations in ug/m3
+    * ``count_0_3`` ... ``count_10``: number of particles of at least 0.3, 0.5, 1.0, 2.5,
+      5.0 and 10 um in one litre of air
+    * ``checksum``: low byte of the sum of the 28 bytes before it
+    * ``timestamp``: :func:`time.monotonic` time the frame was read, None if unknown"""
+
+    __slots__ = _HM3301_FIELDS + ("timestamp",)
+
+    def __init__(self, *values, timestamp=None):
+        if not values:
+            values = (None,) * len(_HM3301_FIELDS)
+        for name, value in zip(_HM3301_FIELDS, values):
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, "timestamp", timestamp)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("HM3301Reading is immutable")
+
+    @classmethod
+    def from_frame(cls, frame, timestamp=None):
+        """Decode a 29 byte frame"""
+        return cls(*_HM3301_FRAME.unpack_from(frame), timestamp=timestamp)
+
+    def __repr__(self):
+        return "HM3301Reading(%s)" % ", ".join(
+            "%s=%r" % (name, getattr(self, name)) for name in self.__slots__
+        )
+
+
+def decode_frames(frames):
+    """Decode many raw frames at once. `frames` is an (N, 29) array of bytes, or a buffer of
+    N frames back to back. Returns a dictionary of NumPy columns, one per field of
+    :class:`HM3301Reading`, plus ``valid``, True where the checksum matches. Needs NumPy."""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+
+    if isinstance(frames, (bytes, bytearray, memoryview)):
+        frames = np.frombuffer(frames, dtype=np.uint8)
+    frames = np.ascontiguousarray(frames, dtype=np.uint8).reshape(-1, _HM3301_DATA_SIZE)
+
+    words = frames[:, :_HM3301_DATA_SIZE - 1].view(">u2")
+    columns = {
+        name: words[:, i].astype(np.uint16) for i, name in enumerate(_HM3301_FIELDS[:-1])
+    }
+    checksum = frames[:, _HM3301_DATA_SIZE - 1]
+    columns["checksum"] = checksum.copy()
+    columns["valid"] = (
+        frames[:, :_HM3301_DATA_SIZE - 1].sum(axis=1, dtype=np.uint32) & 0xFF
+    ) == checksum
+    return columns
 
 class Seeed_HM3301:
     """Driver from HM3301 Particulate Matter sensor
 
     :param int refresh_rate: Maximum number of readings per second. Faster property reads
-      will be from the previous reading."""
+      will be from the previous reading. :meth:`read` always takes a new one.
+    :param int retries: Number of times a frame with a bad checksum is read again before
+      the reading fails with a RuntimeError."""
 
-    def __init__(self, *, refresh_rate=10):
-        """Check the BME680 was found, read the coefficients and enable the sensor for continuous
-        reads."""
+    def __init__(self, *, refresh_rate=10, retries=2):
+        """Check the HM3301 was found"""
+
+        # every frame is read into the same buffer
+        self._buffer = bytearray(_HM3301_DATA_SIZE)
+        self.retries = retries
+        self.crc_errors = 0
+        self.frames_retried = 0
+        self.bad_frames = 0
 
         # Check device ID.
-        chip_id = self._read()[2:4]
-   
-        if chip_id != _HM3301_CHIPID:
-            raise RuntimeError("Failed to find HM3301! Chip ID = " + chip_id.hex())
-
-        self._PM_1_0_conctrt_std = None
-        self._PM_2_5_conctrt_std = None
-        self._PM_10_conctrt_std = None
-        self._PM_1_0_conctrt_atm = None
-        self._PM_2_5_conctrt_atm = None
-        self._PM_10_conctrt_atm = None
-
-        self._last_reading = 0
+        self._readinto(self._buffer)
+        sensor_number = _HM3301_FRAME.unpack_from(self._buffer)[1]
+
+        if sensor_number != _HM3301_SENSOR_NUMBER:
+            raise RuntimeError("Failed to find HM3301! Chip ID = " + self._buffer[2:4].hex())
+
+        self._reading = None
         self._min_refresh_time = 1 / refresh_rate
 
     def check_crc(self, data):
         """Checks the crc of the data packet, retruns True if correct, False otherwise"""
 
-        sum = 0
-        for i in range(_HM3301_DATA_SIZE-1):
-            sum += data[i]
-        sum = sum & 0xff
+        # the last byte is the low byte of the sum of the 28 before it
+        checksum = data[_HM3301_DATA_SIZE - 1]
+        return (sum(data) - checksum) & 0xff == checksum
 
-        return (sum==data[28])
+    def stats(self):
+        """Returns a dictionary with the checksum failure and retry counters"""
+        return {
+            "crc_errors": self.crc_errors,
+            "frames_retried": self.frames_retried,
+            "bad_frames": self.bad_frames,
+        }
+
+    @property
+    def reading(self):
+        """Every field of the last frame as an :class:`HM3301Reading`, read again if it is
+        older than the refresh time."""
+        return self._current()
 
     def get_std_readings(self):
         """The standard concentration of particles in ug/m3."""
-        self._perform_reading()
-        return self._PM_1_0_conctrt_std, self._PM_2_5_conctrt_std, self._PM_10_conctrt_std
+        reading = self._current()
+        return reading.pm1_0_std, reading.pm2_5_std, reading.pm10_std
 
     def get_atm_readings(self):
         """The atmospheric concentration of particles in ug/m3."""
-        self._perform_reading()
-        return self._PM_1_0_conctrt_atm, self._PM_2_5_conctrt_atm, self._PM_10_conctrt_atm
+        reading = self._current()
+        return reading.pm1_0_atm, reading.pm2_5_atm, reading.pm10_atm
 
     @property
     def PM_1_0_conctrt_std(self):
         """The standard concentration of PM1.0 particles in ug/m3."""
-        self._perform_reading()
-        return self._PM_1_0_conctrt_std 
+        return self._current().pm1_0_std
 
     @property
     def PM_2_5_conctrt_std(self):
         """The standard concentration of PM2.5 particles in ug/m3."""
-        self._perform_reading()
-        return self._PM_2_5_conctrt_std 
+        return self._current().pm2_5_std
 
     @property
     def PM_10_conctrt_std(self):
         """The standard concentration of PM10 particles in ug/m3."""
-        self._perform_reading()
-        return self._PM_10_conctrt_std 
+        return self._current().pm10_std
 
     @property
     def PM_1_0_conctrt_atm(self):
         """The atmospheric concentration of PM1.0 particles in ug/m3."""
-        self._perform_reading()
-        return self._PM_1_0_conctrt_atm
+        return self._current().pm1_0_atm
 
     @property
     def PM_2_5_conctrt_atm(self):
         """The atmospheric concentration of PM2.5 particles in ug/m3."""
-        self._perform_reading()
-        return self._PM_2_5_conctrt_atm 
+        return self._current().pm2_5_atm
 
     @property
     def PM_10_conctrt_atm(self):
         """The atmospheric concentration of PM10 particles in ug/m3."""
-        self._perform_reading()
-        return self._PM_10_conctrt_atm
-
-    def _perform_reading(self):
-        """Perform a single-shot reading from the sensor and fill internal data structure for
-        calculations"""
-
-        if time.monotonic() - self._last_reading < self._min_refresh_time:
-            return
-
-        data = self._read(_HM3301_DATA_SIZE)
+        return self._current().pm10_atm
+
+    def read(self):
+        """Read one frame from the sensor and return it as an :class:`HM3301Reading`. The
+        properties show the last frame read."""
+
+        data = self._buffer
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.frames_retried += 1
+            self._readinto(data)
+            if self.check_crc(data):
+                break
+            self.crc_errors += 1
+        else:
+            # keep the previous values, the next reading tries again
+            self.bad_frames += 1
+            raise RuntimeError("HM3301 frame checksum mismatch after %d reads" % (self.retries + 1))
+
+        self._reading = HM3301Reading.from_frame(data, time.monotonic())
+        return self._reading
+
+    def _current(self):
+        # the last reading, or a new one once it is older than the refresh time
+        reading = self._reading
+        if reading is None or time.monotonic() - reading.timestamp >= self._min_refresh_time:
+            reading = self.read()
+        return reading
 
-        self._last_reading = time.monotonic()
-
-        self._PM_1_0_conctrt_std = _read16(data[4:6])
-        self._PM_2_5_conctrt_std = _read16(data[6:8])
-        self._PM_10_conctrt_std = _read16(data[8:10])
-        self._PM_1_0_conctrt_atm = _read16(data[10:12])
-        self._PM_2_5_conctrt_atm = _read16(data[12:14])
-        self._PM_10_conctrt_atm = _read16(data[14:16])
+    def _read(self, length=_HM3301_DATA_SIZE):
+        """Returns a new array of 'length' bytes read from the sensor"""
+        result = bytearray(length)
+        self._readinto(result)
+        return result
 
-    def _read(self, length):
+    def _readinto(self, buffer):
         raise NotImplementedError()
 
     def _write(self, register, values):
@@ -187,7 +283,7 @@ class HM3301_I2C(Seeed_HM3301):
 
     """
 
-    def __init__(self, i2c, address=0x40, debug=False, *, refresh_rate=10):
+    def __init__(self, i2c, address=0x40, debug=False, *, refresh_rate=10, retries=2):
         """Initialize the I2C device at the 'address' given"""
         from adafruit_bus_device import (  # pylint: disable=import-outside-toplevel
             i2c_device,
@@ -195,18 +291,15 @@ class HM3301_I2C(Seeed_HM3301):
 
         self._i2c = i2c_device.I2CDevice(i2c, address)
         self._debug = debug
-        super().__init__(refresh_rate=refresh_rate)
+        super().__init__(refresh_rate=refresh_rate, retries=retries)
 
-    def _read(self, length=_HM3301_DATA_SIZE):
-        """Returns an array of 'length' bytes from the 'register'"""
+    def _readinto(self, buffer):
+        """Fill 'buffer' with the next frame of the sensor"""
         with self._i2c as i2c:
-            result = bytearray(length)
-            i2c.readinto(result)
+            i2c.readinto(buffer)
 
             if self._debug:
-                print("\t$%02X => %s" % (register, [hex(i) for i in result]))
-
-            return result
+                print("\t$%02X => %s" % (self._i2c.device_address, [hex(i) for i in buffer]))
 
 
 
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the station modules and the hardware fakes are imported as top-level modules
+_STATION = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [_STATION, os.path.join(_STATION, "benchmarks")]
@@ -0,0 +1,93 @@
+"""
+Tests of the Air530 driver against the simulated module of `fakes`.
+"""
+
+import time
+
+import pytest
+
+import fakes
+import main
+from seeed_air530 import GPS
+
+# the sentences of a module without ZDA output
+NO_ZDA = b"".join(line for line in fakes.sample_nmea(5).splitlines(True)
+                  if line[3:6] in (b"RMC", b"GGA", b"GSA", b"GSV"))
+
+
+def poll(gps, seconds):
+    """Feed `gps` what the port receives for `seconds`"""
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        gps.update()
+        time.sleep(0.01)
+
+
+def test_configure_without_ack_keeps_every_sentence():
+    uart = fakes.FakeSerial(baudrate=9600, timeout=0.1, data=NO_ZDA, speed=20, pmtk=False)
+    gps = GPS(uart, bulk_read=True)
+
+    assert not gps.configure(main.gps_fields, timeout=0.1, retries=0)
+    assert gps.output_sentences is None
+
+    poll(gps, 0.5)
+    assert gps.sentences_accepted.get("GNRMC")
+    assert not gps.sentences_skipped
+    assert gps.utc_epoch is not None
+
+
+def test_configure_restores_sentences_when_the_rate_is_refused():
+    uart = fakes.FakeSerial(baudrate=9600, timeout=0.1, data=NO_ZDA, speed=20)
+    handle_command = uart.module._handle_command  # pylint: disable=protected-access
+
+    def refuse_rate(line):
+        return b"" if line.startswith(b"$PMTK220") else handle_command(line)
+
+    uart.module._handle_command = refuse_rate  # pylint: disable=protected-access
+    gps = GPS(uart, bulk_read=True)
+
+    assert not gps.configure(main.gps_fields, timeout=0.1, retries=0)
+    assert gps.output_sentences is None
+    assert gps.fix_interval is None
+
+
+def test_noise_is_counted_under_one_address():
+    gps = GPS(fakes.FakeSerial(), sentences=("GGA",))
+    noise = bytes(range(0x80, 0x100)) * 4
+    for i in range(0, len(noise), 7):
+        gps.feed(noise[i:i + 7] + b",x\r\n")
+    gps.feed(fakes.sample_nmea(1))
+
+    assert set(gps.sentences_accepted) == {"GNGGA"}
+    assert set(gps.sentences_skipped) == {"?", "GNGSA", "GPGSV", "GNRMC", "GNZDA", "GPTXT"}
+
+
+class FlakySerial(fakes.FakeSerial):
+    """FakeSerial whose reads fail `failures` times, like a USB UART dropping out"""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+
+    def read(self, size=1):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("device reports readiness to read but returned no data")
+        return super().read(size)
+
+
+def test_reader_survives_uart_errors():
+    gps = GPS(FlakySerial(3, timeout=0.1, speed=20))
+    gps.start_reader()
+    try:
+        time.sleep(0.5)
+        with pytest.raises(OSError):
+            gps.update()
+        assert gps.reader_errors == 3
+
+        # the reader kept going and the next update is clean
+        time.sleep(0.2)
+        assert gps.update()
+        assert gps.utc_epoch is not None
+    finally:
+        gps.stop_reader(1)
@@ -0,0 +1,48 @@
+"""
+Tests of the per-bus transaction queue against the fake BME680.
+"""
+
+import fakes
+from busmanager import BusManager
+
+
+def make_bus():
+    bme680 = fakes.FakeBME680(0x76)
+    manager = BusManager(fakes.FakeI2C([bme680]), coalesce=(0x76,))
+    return manager, manager.client(), bme680
+
+
+def test_coalesced_writes_then_read():
+    manager, i2c, bme680 = make_bus()
+    try:
+        # the register writes of a measurement, then the read of CTRL_MEAS
+        i2c.writeto(0x76, bytes((0x75, 0x08)))
+        i2c.writeto(0x76, bytes((0x74, 0x8C)))
+        i2c.writeto(0x76, bytes((0x72, 0x02)))
+        i2c.writeto(0x76, bytes((0x71, 0x10)))
+        i2c.writeto(0x76, bytes((0x74,)))
+        buffer = bytearray(1)
+        i2c.readfrom_into(0x76, buffer)
+
+        assert buffer[0] == 0x8C
+        assert bytes(bme680.registers[0x71:0x76]) == bytes((0x10, 0x02, 0, 0x8C, 0x08))
+        # the pointer write is a transfer of its own
+        assert manager.transfers == 3
+    finally:
+        manager.close(1)
+
+
+def test_bme680_measurement_through_the_manager():
+    from seeed_bme680 import Adafruit_BME680_I2C  # pylint: disable=import-outside-toplevel
+
+    manager, i2c, bme680 = make_bus()
+    try:
+        sensor = Adafruit_BME680_I2C(i2c, address=0x76)
+        sensor.read()
+        # the oversampling settings of the driver and forced mode
+        assert bme680.registers[0x74] == 0x8D
+        assert sensor.temperature_oversample == 8 and sensor.pressure_oversample == 4
+        assert bme680.registers[0x72] == 0x02
+        assert manager.coalesced
+    finally:
+        manager.close(1)
@@ -0,0 +1,272 @@
+"""
+Tests of the OLED frame cache, the dirty window computation and the
+render-on-change display wrapper, against an emulated SSD1306 GDDRAM.
+"""
+
+import random
+
+import pytest
+
+import display
+from display import FrameCache, OledDisplay, dirty_windows
+
+
+class Gddram:
+    """SSD1306 display RAM behind an i2c device: 128 columns by 8 pages, written in
+    horizontal addressing mode through column and page address windows"""
+
+    def __init__(self):
+        self.ram = bytearray(128 * 8)
+        self.writes = 0
+        self._columns = (0, 127)
+        self._pages = (0, 7)
+        self._column = 0
+        self._page = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def write(self, data):
+        self.writes += 1
+        if data[0] == 0x00:
+            self._command(data[1:])
+        elif data[0] == 0x40:
+            self._data(data[1:])
+        else:
+            raise AssertionError("unexpected control byte 0x%02X" % data[0])
+
+    def _command(self, commands):
+        i = 0
+        while i < len(commands):
+            command = commands[i]
+            if command == 0x21:
+                self._columns = (commands[i + 1], commands[i + 2])
+                self._column = self._columns[0]
+                i += 3
+            elif command == 0x22:
+                self._pages = (commands[i + 1], commands[i + 2])
+                self._page = self._pages[0]
+                i += 3
+            else:
+                raise AssertionError("unexpected command 0x%02X" % command)
+
+    def _data(self, data):
+        for byte in data:
+            self.ram[self._page * 128 + self._column] = byte
+            # the column wraps inside the window and moves to the next page
+            self._column += 1
+            if self._column > self._columns[1]:
+                self._column = self._columns[0]
+                self._page += 1
+                if self._page > self._pages[1]:
+                    self._page = self._pages[0]
+
+    def frame(self, width, height):
+        """The packed frame shown by a `width` x `height` panel, centred like the driver"""
+        offset = (128 - width) // 2 if width != 128 else 0
+        return b"".join(bytes(self.ram[page * 128 + offset:page * 128 + offset + width])
+                        for page in range(height // 8))
+
+
+class FakeOled:
+    """The parts of adafruit_ssd1306.SSD1306_I2C used by OledDisplay"""
+
+    def __init__(self, width=128, height=64):
+        self.width = width
+        self.height = height
+        self.buf = bytearray(width * height // 8)
+        self.i2c_device = Gddram()
+        self.shows = 0
+
+    def show(self):
+        offset = (128 - self.width) // 2 if self.width != 128 else 0
+        self.i2c_device.write(bytes((0x00, 0x21, offset, offset + self.width - 1,
+                                     0x22, 0, self.height // 8 - 1)))
+        self.i2c_device.write(b"\x40" + bytes(self.buf))
+        self.shows += 1
+
+
+def send(oled, screen, frame):
+    # push `frame` the way show_text() does after rendering it
+    oled.buf[:] = frame
+    screen._push()  # pylint: disable=protected-access
+
+
+def with_changes(frame, width, changes):
+    # `frame` with the byte at each (page, column) of `changes` inverted
+    frame = bytearray(frame)
+    for page, column in changes:
+        frame[page * width + column] ^= 0xFF
+    return bytes(frame)
+
+
+@pytest.mark.parametrize("width,height", [(128, 64), (128, 32), (64, 48), (96, 16)])
+def test_windows_rebuild_the_new_frame(width, height):
+    rng = random.Random(width * height)
+    oled = FakeOled(width, height)
+    screen = OledDisplay(oled, cache=FrameCache())
+    size = width * height // 8
+
+    frame = bytes(rng.getrandbits(8) for _ in range(size))
+    send(oled, screen, frame)
+    assert oled.i2c_device.frame(width, height) == frame
+
+    for _ in range(50):
+        changes = [(rng.randrange(height // 8), rng.randrange(width))
+                   for _ in range(rng.randrange(1, 12))]
+        frame = with_changes(frame, width, changes)
+        send(oled, screen, frame)
+        assert oled.i2c_device.frame(width, height) == frame
+    assert oled.shows == 1
+
+
+@pytest.mark.parametrize("width,height", [(128, 64), (64, 48)])
+def test_first_and_last_columns(width, height):
+    old = bytes(width * height // 8)
+    last_page = height // 8 - 1
+    new = with_changes(old, width, [(0, 0), (last_page, width - 1)])
+
+    windows = dirty_windows(old, new, width)
+    assert windows == [(0, 0, 0, 0), (last_page, last_page, width - 1, width - 1)]
+
+    oled = FakeOled(width, height)
+    screen = OledDisplay(oled, cache=FrameCache())
+    send(oled, screen, old)
+    send(oled, screen, new)
+    assert oled.i2c_device.frame(width, height) == new
+
+
+def test_adjacent_pages_are_merged_when_cheaper():
+    width = 128
+    old = bytes(width * 8)
+    # the same columns on pages 2 and 3 fit in one window
+    new = with_changes(old, width, [(2, 40), (2, 60), (3, 41), (3, 59)])
+    assert dirty_windows(old, new, width) == [(2, 3, 40, 60)]
+
+
+def test_adjacent_pages_are_kept_separate_when_merging_costs_more():
+    width = 128
+    old = bytes(width * 8)
+    # a merged window would span every column of both pages
+    new = with_changes(old, width, [(2, 0), (3, 127)])
+    assert dirty_windows(old, new, width) == [(2, 2, 0, 0), (3, 3, 127, 127)]
+
+
+def test_unchanged_frame_has_no_window():
+    frame = bytes(range(256)) * 4
+    assert dirty_windows(frame, frame, 128) == []
+
+
+def test_narrow_display_uses_the_column_offset():
+    oled = FakeOled(64, 48)
+    screen = OledDisplay(oled, cache=FrameCache())
+    old = bytes(64 * 6)
+    send(oled, screen, old)
+    send(oled, screen, with_changes(old, 64, [(1, 0), (1, 63)]))
+
+    # columns 32 to 95 of the RAM show the 64 columns of the panel
+    assert oled.i2c_device.ram[128 + 32] == 0xFF
+    assert oled.i2c_device.ram[128 + 95] == 0xFF
+    assert oled.i2c_device.ram.count(0xFF) == 2
+
+
+class TestFrameCache:
+
+    def test_least_recently_used_is_evicted(self):
+        cache = FrameCache(max_entries=2)
+        cache.put("a", b"1")
+        cache.put("b", b"2")
+        assert cache.get("a") == b"1"
+        cache.put("c", b"3")
+
+        assert cache.get("b") is None
+        assert cache.get("a") == b"1"
+        assert cache.get("c") == b"3"
+        assert cache.evictions == 1
+        assert cache.stats()["hits"] == 3
+        assert cache.stats()["misses"] == 1
+
+    def test_max_bytes(self):
+        cache = FrameCache(max_entries=10, max_bytes=10)
+        cache.put("a", b"x" * 4)
+        cache.put("b", b"x" * 4)
+        cache.put("c", b"x" * 4)
+
+        assert len(cache) == 2
+        assert cache.nbytes == 8
+        assert cache.get("a") is None
+
+    def test_replacing_a_key(self):
+        cache = FrameCache(max_entries=2, max_bytes=10)
+        cache.put("a", b"x" * 4)
+        cache.put("b", b"x" * 4)
+        cache.put("a", b"x" * 6)
+
+        assert len(cache) == 2
+        assert cache.nbytes == 10
+        assert cache.evictions == 0
+        assert cache.get("a") == b"x" * 6
+        # "a" is now the most recently used
+        cache.put("c", b"x")
+        assert cache.get("b") is None
+
+    def test_frame_larger_than_max_bytes_is_not_cached(self):
+        cache = FrameCache(max_bytes=8)
+        cache.put("a", b"x" * 4)
+        cache.put("big", b"x" * 9)
+
+        assert cache.get("big") is None
+        assert cache.get("a") == b"x" * 4
+        assert cache.nbytes == 4
+        assert cache.evictions == 0
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Replaces the PIL renderer by one packing the text, returns the rendered texts"""
+    rendered = []
+
+    def render_frame(width, height, text, data=False):
+        rendered.append((text, data))
+        return text.encode().ljust(width * height // 8, b"\x00")[:width * height // 8]
+
+    monkeypatch.setattr(display, "render_frame", render_frame)
+    return rendered
+
+
+def test_show_text_skips_an_unchanged_frame(renders):
+    oled = FakeOled()
+    screen = OledDisplay(oled, cache=FrameCache())
+
+    assert screen.show_text("12.3", data=True)
+    writes = oled.i2c_device.writes
+    assert not screen.show_text("12.3", data=True)
+
+    assert renders == [("12.3", True)]
+    assert oled.i2c_device.writes == writes
+    assert screen.stats()["frames_skipped"] == 1
+
+    # the same text in the other layout is another frame
+    assert screen.show_text("12.3")
+    assert renders == [("12.3", True), ("12.3", False)]
+
+
+def test_invalidate_forces_a_full_redraw(renders):
+    oled = FakeOled()
+    screen = OledDisplay(oled, cache=FrameCache())
+    screen.show_text("Lat")
+    screen.show_text("Lon")
+    assert oled.shows == 1
+
+    screen.invalidate()
+    # the display RAM was lost, e.g. by a power cycle of the panel
+    oled.i2c_device.ram[:] = bytes(len(oled.i2c_device.ram))
+    assert screen.show_text("Lon")
+
+    assert oled.shows == 2
+    assert oled.i2c_device.frame(128, 64) == bytes(oled.buf)
+    # the frame came from the cache
+    assert renders == [("Lat", False), ("Lon", False)]
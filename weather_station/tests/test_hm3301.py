@@ -0,0 +1,91 @@
+"""
+Tests of the HM3301 checksum retries against a sensor model with chosen bad frames,
+and of the NumPy bulk decoder against the per-frame decode.
+"""
+
+import pytest
+
+from fakes import FakeHM3301, FakeI2C
+from seeed_hm3301 import (
+    _HM3301_FIELDS, HM3301_I2C, HM3301Reading, Seeed_HM3301, decode_frames,
+)
+
+
+class ScriptedHM3301(FakeHM3301):
+    """FakeHM3301 with a flipped bit in the frames numbered in `corrupt`, counting from 1.
+    Frame 1 is read by the driver to check the sensor number."""
+
+    def __init__(self, corrupt=()):
+        super().__init__()
+        self.corrupt = set(corrupt)
+
+    def frame(self):
+        frame = super().frame()
+        if self.frames in self.corrupt:
+            frame[6] ^= 0x04
+        return frame
+
+
+def sensor(corrupt=(), retries=2):
+    model = ScriptedHM3301(corrupt)
+    # one reading every 1000 s, so the properties never read a frame themselves
+    return model, HM3301_I2C(FakeI2C([model]), refresh_rate=0.001, retries=retries)
+
+
+def test_corrupt_frame_is_read_again():
+    model, hm3301 = sensor(corrupt={2, 3})
+
+    reading = hm3301.read()
+
+    assert model.frames == 4
+    assert reading.sensor_number == 0x001C
+    assert reading.pm2_5_std == 8
+    assert hm3301.stats() == {"crc_errors": 2, "frames_retried": 2, "bad_frames": 0}
+
+
+def test_all_frames_corrupt():
+    model, hm3301 = sensor(corrupt={2, 3, 4})
+
+    with pytest.raises(RuntimeError, match="checksum mismatch after 3 reads"):
+        hm3301.read()
+
+    assert model.frames == 4
+    assert hm3301.stats() == {"crc_errors": 3, "frames_retried": 2, "bad_frames": 1}
+
+    # the next reading starts over with a full set of retries
+    reading = hm3301.read()
+    assert reading.pm2_5_std == 8
+    assert hm3301.stats() == {"crc_errors": 3, "frames_retried": 2, "bad_frames": 1}
+
+
+def test_failed_read_keeps_the_previous_reading():
+    _, hm3301 = sensor(corrupt={3}, retries=0)
+    first = hm3301.read()
+
+    with pytest.raises(RuntimeError, match="after 1 reads"):
+        hm3301.read()
+
+    assert hm3301.reading is first
+    assert hm3301.stats() == {"crc_errors": 1, "frames_retried": 0, "bad_frames": 1}
+
+
+def test_bulk_decode_matches_the_frame_decode():
+    np = pytest.importorskip("numpy")
+    model = ScriptedHM3301(corrupt={3, 7, 10})
+    frames = [model.frame() for _ in range(12)]
+    # a checksum that only matches when the sum is taken modulo 256
+    frames.append(bytearray(b"\xff" * 28) + bytes((0xff * 28 & 0xFF,)))
+    frames.append(bytearray(b"\xff" * 28) + bytes((0xff * 28 & 0xFF ^ 1,)))
+
+    columns = decode_frames(b"".join(frames))
+    same = decode_frames(np.frombuffer(b"".join(frames), dtype=np.uint8).reshape(-1, 29))
+
+    hm3301 = Seeed_HM3301.__new__(Seeed_HM3301)
+    for i, frame in enumerate(frames):
+        reading = HM3301Reading.from_frame(frame)
+        for name in _HM3301_FIELDS:
+            assert columns[name][i] == getattr(reading, name), name
+            assert same[name][i] == getattr(reading, name), name
+        assert bool(columns["valid"][i]) == hm3301.check_crc(frame)
+    expected = [number not in model.corrupt for number in range(1, 13)] + [True, False]
+    assert columns["valid"].tolist() == expected
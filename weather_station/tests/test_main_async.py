@@ -0,0 +1,53 @@
+"""
+Test that the asyncio entry point runs the station without background threads.
+"""
+
+import asyncio
+import sys
+import threading
+
+import pytest
+
+import fakes
+from acquisition import Snapshot
+
+
+@pytest.fixture
+def station(monkeypatch):
+    """The main module on top of the fake hardware, restoring the real modules after"""
+    for name in ("board", "busio", "serial", "RPi", "RPi.GPIO"):
+        monkeypatch.setitem(sys.modules, name, sys.modules.get(name))
+    hardware = fakes.Hardware(nmea_speed=20.0)
+    fakes.install(hardware)
+
+    import main  # pylint: disable=import-outside-toplevel
+
+    monkeypatch.setattr(main, "configure_bus_clock", lambda *args, **kwargs: True)
+    monkeypatch.setattr(main, "stats_interval", 0)
+    monkeypatch.setattr(main, "buses", [])
+    monkeypatch.setattr(main, "snapshot", Snapshot())
+    return main
+
+
+def test_async_main_starts_no_threads(station):
+    import main_async  # pylint: disable=import-outside-toplevel
+
+    threads = []
+
+    async def run():
+        task = asyncio.ensure_future(main_async.main())
+        await asyncio.sleep(1.5)
+        threads.extend(thread.name for thread in threading.enumerate())
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    assert station.buses == []
+    assert not [name for name in threads if name == "air530-uart" or name.endswith("-bus")]
+    # the GPS was polled from the loop with the bulk reads
+    gps = station.snapshot.get("gps")
+    assert gps is not None and gps.error is None
+    assert gps.value[0] != "No Fix"
+    assert station.snapshot.get("hm3301") is not None
@@ -0,0 +1,49 @@
+"""
+Tests of the NMEA log replay tool.
+"""
+
+import fakes
+import nmea_replay
+
+
+def rounded(value):
+    # floats merged in another order differ in their last digits
+    if isinstance(value, float):
+        return round(value, 6)
+    if isinstance(value, dict):
+        return {key: rounded(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [rounded(item) for item in value]
+    return value
+
+
+def write_log(path):
+    # 20 epochs without a fix before the fixes of fakes.sample_nmea()
+    lines = []
+    for second in range(40, 60):
+        lines.append(fakes.nmea_sentence(b"GNGGA,1020%02d.000,,,,,0,00,99.99,,,,,," % second))
+        lines.append(fakes.nmea_sentence(b"GPTXT,01,01,01,ANTENNA OPEN"))
+    path.write_bytes(b"".join(lines) + fakes.sample_nmea(40))
+    return str(path)
+
+
+def test_replay_serial_and_pool_agree(tmp_path):
+    log = write_log(tmp_path / "nmea.log")
+    # the first fix is several chunks into the file
+    serial = nmea_replay.replay([log], jobs=1, chunk_size=1500).summary()
+    pool = nmea_replay.replay([log], jobs=2, chunk_size=1500).summary()
+
+    assert rounded(serial) == rounded(pool)
+    assert serial["epochs"] == 60
+    assert serial["fixed_epochs"] == 40
+    assert serial["time_to_first_fix_s"]["files"] == {log: 20}
+    # the TXT lines are dropped by the sentence filter
+    assert serial["rejected_lines"] == 60
+
+
+def test_replay_without_fix(tmp_path):
+    log = tmp_path / "nofix.log"
+    log.write_bytes(fakes.nmea_sentence(b"GNGGA,102040.000,,,,,0,00,99.99,,,,,,"))
+    summary = nmea_replay.replay([str(log)], jobs=1).summary()
+    assert summary["time_to_first_fix_s"]["files"] == {str(log): None}
+    assert summary["files"] == 1
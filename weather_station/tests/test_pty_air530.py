@@ -0,0 +1,71 @@
+"""
+Tests of the Air530 baud rate negotiation and PMTK configuration against the
+module simulated by :class:`fakes.PtyAir530` through a real serial port.
+"""
+
+import os
+
+import pytest
+
+import fakes
+import main
+from seeed_air530 import GPS
+
+serial = pytest.importorskip("serial")
+pytest.importorskip("termios")
+if not hasattr(os, "openpty"):
+    pytest.skip("no pseudo terminals", allow_module_level=True)
+
+
+@pytest.fixture
+def module(request):
+    pmtk = getattr(request, "param", True)
+    try:
+        pty = fakes.PtyAir530(pmtk=pmtk)
+    except OSError as error:
+        pytest.skip("no pseudo terminal: %s" % error)
+    with pty:
+        yield pty
+
+
+@pytest.fixture
+def gps(module):
+    uart = serial.Serial(module.port, baudrate=9600, timeout=0.1)
+    try:
+        yield GPS(uart, bulk_read=True)
+    finally:
+        uart.close()
+
+
+def test_negotiate_baudrate(module, gps):
+    assert gps.negotiate_baudrate((115200,), timeout=2.5) == 115200
+    assert module.module.baudrate == 115200
+    assert module.host_baudrate == 115200
+
+
+def test_negotiate_baudrate_falls_back(module, gps):
+    # the module never switches, the port has to come back to 9600
+    module.module.receive = lambda data: b""
+    assert gps.negotiate_baudrate((57600,), timeout=1.5) == 9600
+    assert module.host_baudrate == 9600
+
+
+def test_configure_sets_the_fix_rate(module, gps):
+    assert gps.negotiate_baudrate((115200,), timeout=2.5) == 115200
+    assert gps.configure(main.gps_fields, rate=5, timeout=0.5)
+    assert gps.fix_interval == 200
+    assert module.module.fix_interval == 200
+    assert b"PMTK220,200" in module.module.commands
+    assert gps.output_sentences == ("GGA", "ZDA")
+
+
+@pytest.mark.parametrize("module", [False], indirect=True)
+def test_configure_without_ack(module, gps):
+    assert not gps.configure(main.gps_fields, timeout=0.3, retries=1)
+    assert gps.output_sentences is None
+    assert module.module.fix_interval == 1000
+
+    # the module still sends everything and the parser takes it
+    gps._wait_sentences(2.5, count=10)  # pylint: disable=protected-access
+    assert gps.sentences_accepted.get("GNRMC")
+    assert gps.utc_epoch is not None
@@ -0,0 +1,16 @@
+"""
+Tests of the deadline scheduler.
+"""
+
+from scheduler import Scheduler
+
+
+def test_trigger_before_the_task_is_added():
+    scheduler = Scheduler()
+    scheduler.trigger('oled1')
+
+    runs = []
+    scheduler.add('oled1', lambda: runs.append(1), 10.0, delay=10.0)
+    scheduler.trigger('oled1')
+    scheduler.run_pending()
+    assert runs == [1]
@@ -0,0 +1,33 @@
+"""
+Tests of the track history recorded by the station.
+"""
+
+import math
+import time
+
+import fakes
+import main
+from seeed_air530 import GPS
+from track import Track
+
+
+def test_fixes_within_one_second_have_their_own_time(monkeypatch):
+    monkeypatch.setattr(main, "track", Track(100))
+    monkeypatch.setattr(main, "_last_fix", None)
+    gps = GPS(fakes.FakeSerial())
+
+    # 5 Hz fixes, 10 m apart
+    for i in range(5):
+        hms = b"102100.%03d" % (200 * i)
+        lat = b"%09.4f" % (3554.9000 + 0.0054 * i)
+        gps.feed(fakes.nmea_sentence(b"GNRMC,%s,A,%s,N,01429.7000,E,1.20,0.00,090721,,,A" % (hms, lat)))
+        gps.feed(fakes.nmea_sentence(b"GNGGA,%s,%s,N,01429.7000,E,1,08,1.02,52.0,M,46.9,M,," % (hms, lat)))
+        main.record_fix(gps)
+        time.sleep(0.02)
+
+    assert len(main.track) == 5
+    speeds = main.track.speeds()
+    assert len(speeds) == 4
+    assert all(math.isfinite(speed) and speed > 0 for speed in speeds)
+    utc = main.track.window().utc
+    assert all(later > earlier for earlier, later in zip(utc, utc[1:]))
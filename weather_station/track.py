@@ -0,0 +1,192 @@
+"""
+`track`
+================================================================================
+
+GPS track history for vehicle mounted weather stations.
+
+:class:`Track` keeps the last `capacity` fixes in preallocated NumPy arrays
+used as a ring buffer, with the :func:`time.monotonic` time the fix was
+recorded and its UTC time. Distance, ground speed, bearing and bounding box
+queries over any time window are computed on whole arrays at once. The
+distance from the previous fix is stored with every fix, so the summary of an
+hour of 10 Hz fixes takes well under a millisecond.
+"""
+
+import math
+from collections import namedtuple
+
+import numpy as np
+
+# mean earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+Window = namedtuple('Window', ('monotonic', 'utc', 'latitude', 'longitude', 'altitude'))
+Window.__doc__ = """Fixes of a :class:`Track` window in chronological order, one array per field.
+
+:param monotonic: :func:`time.monotonic` times the fixes were recorded.
+:param utc: UTC times of the fixes in seconds since the epoch, NaN if unknown.
+:param latitude: Latitudes in degrees.
+:param longitude: Longitudes in degrees.
+:param altitude: Altitudes in meters, NaN if unknown."""
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in meters between points given in degrees. Takes scalars or arrays."""
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """Initial bearing in degrees from north, 0 to 360, from the first points to the second"""
+    lat1, lon1, lat2, lon2 = np.radians(lat1), np.radians(lon1), np.radians(lat2), np.radians(lon2)
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+
+def _bbox(window):
+    if not len(window.latitude):
+        return None
+    return (float(window.latitude.min()), float(window.longitude.min()),
+            float(window.latitude.max()), float(window.longitude.max()))
+
+
+class Track:
+    """Fixed capacity ring buffer of GPS fixes. Once full, every new fix replaces the oldest one.
+
+    The queries take a `seconds` argument selecting the fixes recorded in the last
+    `seconds` before the newest one, None selects the whole history.
+
+    :param int capacity: Number of fixes kept, one hour at 10 Hz by default."""
+
+    def __init__(self, capacity=36000):
+        self.capacity = capacity
+        # one row per field of Window, then the distance in meters from the previous fix
+        self._fixes = np.full((len(Window._fields) + 1, capacity), np.nan)
+        self._last = None
+        self._next = 0
+        self._count = 0
+        self.fixes_recorded = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, monotonic, latitude, longitude, altitude=None, utc=None):
+        """Record a fix taken at :func:`time.monotonic` time `monotonic`, with its UTC time
+        `utc` in seconds since the epoch if known"""
+        lat = math.radians(latitude)
+        lon = math.radians(longitude)
+        cos_lat = math.cos(lat)
+        step = math.nan
+        if self._last is not None:
+            lat0, lon0, cos_lat0 = self._last
+            a = math.sin((lat - lat0) / 2) ** 2 + cos_lat0 * cos_lat * math.sin((lon - lon0) / 2) ** 2
+            step = 2 * EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+        self._last = (lat, lon, cos_lat)
+
+        self._fixes[:, self._next] = (
+            monotonic,
+            math.nan if utc is None else utc,
+            latitude,
+            longitude,
+            math.nan if altitude is None else altitude,
+            step,
+        )
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        self.fixes_recorded += 1
+
+    def clear(self):
+        """Forget every fix"""
+        self._next = 0
+        self._count = 0
+        self._last = None
+
+    def window(self, seconds=None):
+        """Returns the :class:`Window` of the fixes of the last `seconds`"""
+        return Window(*self._window(seconds)[:-1])
+
+    def _window(self, seconds):
+        # the rows of the fixes of the last seconds in chronological order
+        fixes = self._fixes
+        if self._count < self.capacity:
+            ordered = fixes[:, :self._count]
+        elif self._next == 0:
+            ordered = fixes
+        else:
+            ordered = np.concatenate((fixes[:, self._next:], fixes[:, :self._next]), axis=1)
+
+        if seconds is not None and self._count:
+            times = ordered[0]
+            ordered = ordered[:, np.searchsorted(times, times[-1] - seconds):]
+
+        return ordered
+
+    def distances(self, seconds=None):
+        """Returns the distance in meters between each pair of consecutive fixes"""
+        return self._window(seconds)[-1, 1:]
+
+    def distance(self, seconds=None):
+        """Returns the distance in meters travelled along the track"""
+        return float(np.sum(self.distances(seconds)))
+
+    def speeds(self, seconds=None):
+        """Returns the ground speed in m/s between each pair of consecutive fixes, NaN where
+        both fixes were recorded at the same time"""
+        rows = self._window(seconds)
+        dt = np.diff(rows[0])
+        meters = rows[-1, 1:]
+        return np.divide(meters, dt, out=np.full_like(meters, np.nan), where=dt > 0)
+
+    def bearings(self, seconds=None):
+        """Returns the bearing in degrees from each fix to the next"""
+        w = self.window(seconds)
+        return bearing(w.latitude[:-1], w.longitude[:-1], w.latitude[1:], w.longitude[1:])
+
+    def bbox(self, seconds=None):
+        """Returns the (min latitude, min longitude, max latitude, max longitude) of the fixes,
+        or None without any fix"""
+        return _bbox(self.window(seconds))
+
+    def summary(self, seconds=None):
+        """Returns a dictionary with the fix count, duration, distance, mean and maximum speed,
+        bearing from the first to the last fix, bounding box, altitude range and UTC range of
+        the fixes of the last `seconds`"""
+        rows = self._window(seconds)
+        w = Window(*rows[:-1])
+        count = len(w.monotonic)
+        summary = {
+            'fixes': count,
+            'duration_s': 0.0,
+            'distance_m': 0.0,
+            'mean_speed_ms': None,
+            'max_speed_ms': None,
+            'bearing_deg': None,
+            'bbox': _bbox(w),
+            'altitude_m': None,
+            'utc': None,
+        }
+        if count < 2:
+            return summary
+
+        lat, lon = w.latitude, w.longitude
+        meters = rows[-1, 1:]
+        dt = np.diff(w.monotonic)
+        moving = dt > 0
+        duration = float(w.monotonic[-1] - w.monotonic[0])
+        distance = float(meters.sum())
+
+        summary['duration_s'] = duration
+        summary['distance_m'] = distance
+        if duration > 0:
+            summary['mean_speed_ms'] = distance / duration
+        if moving.any():
+            summary['max_speed_ms'] = float(np.max(meters[moving] / dt[moving]))
+        summary['bearing_deg'] = float(bearing(lat[0], lon[0], lat[-1], lon[-1]))
+        if not np.isnan(w.altitude).all():
+            summary['altitude_m'] = (float(np.nanmin(w.altitude)), float(np.nanmax(w.altitude)))
+        if not np.isnan(w.utc).all():
+            summary['utc'] = (float(np.nanmin(w.utc)), float(np.nanmax(w.utc)))
+        return summary